@@ -5,27 +5,41 @@
 # @Link    : https://github.com/Litles
 # @Version : 1.2
 
+import io
 import os
+import copy
+import argparse
 import sys
+import shutil
 import traceback
-import subprocess
-from time import sleep, perf_counter
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import deque
+from time import perf_counter
 from func_lib import get_charset, generate_mapping_table_pingyin
-from func_lib import get_dkp, get_hu_ji, get_xkp, get_xzgr
+from func_lib import compile_charset_pattern, iter_runs, encode_line, DuoyinMatcher
+from perf_lib import PerfEngine, NgramIndex, load_layouts, load_metrics
+from rime_lib import ConsolePool, LibrimeEngine, DeployManager, find_librime
+from cache_lib import hash_files, hash_dir, load_cache, save_cache, ResultStore, Dedup
+from stats_lib import STATS_VERSION, SentenceStats, ErrorIndex, LatencyStats, StratifiedSample, bucket_of
+from qiefen_lib import analyze_qiefen, save_qiefen
+from corpus_lib import SIZE_SHARD, iter_shard_ranges, read_shard, input_key, ShardManifest, Checkpoint
 from tqdm import tqdm
 
 import func_lib
 
 class AutoRime:
-    def __init__(self, pingyin_flg: bool=False, len_min: int=1, len_code: int=0):
+    def __init__(self, pingyin_flg: bool=False, len_min: int=1, len_code: int=0, num_workers: int=0, backend: str="console",
+                 low_memory: bool=False, incremental: bool=True, deploy: bool=True):
         self.pingyin_flg = pingyin_flg
+        self.low_memory = low_memory  # (拼音方案)以低内存模式生成映射表
         self.len_min = len_min
         self.len_code = len_code
+        self.num_workers = num_workers  # 并行模拟的进程数, 0 表示按 CPU 核数
+        self.backend = backend  # console: rime_api_console 进程; librime: 进程内调用动态库
+        self.incremental = incremental  # 复用以往的模拟结果
         # 0.识别程序根目录(当前 py 或打包后 exe 所在的目录)的绝对路径
-        if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
-            self.dir_bundle = os.path.split(sys._MEIPASS)[0]
-        else:
-            self.dir_bundle = os.getcwd()
+        self.dir_bundle = get_dir_bundle()
 
         # 1.Rime 相关程序的路径
         if sys.platform == 'win32':
@@ -53,36 +67,61 @@ class AutoRime:
         # 2.AutoRime 相关路径
         self.dir_charsets = os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'charsets')
         self.dir_articles = os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'articles')
-        self.fname_sup = 'sup.txt'
         # a) 处理好的文章
         self.dir_articles_pre = os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'articles_pre')
         self.dir_articles_ready = os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'articles_ready')
-        self.file_ready_sup = os.path.join(self.dir_articles_ready, self.fname_sup)
         # b) Rime 的输入
         self.dir_in = os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'input')
-        self.file_in_sup = os.path.join(self.dir_in, self.fname_sup)
         # c) Rime 的输出
         self.dir_out = os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'output')
-        self.file_out_sup = os.path.join(self.dir_out, self.fname_sup)
-        # d) Rime 的输出
+        # d) 并行模拟时各进程的 Rime 用户目录
+        self.dir_workers = os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'workers')
+        # e) 分片模式的进度和各分片结果
+        self.dir_shards = os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'shards')
+        # f) 逐篇模拟的断点记录
+        self.checkpoint = Checkpoint(os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'checkpoints'))
+        self.key_build = None  # Rime 部署结果的摘要
+        # g) 未匹配的行
         self.dir_unmatched = os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'unmatched_lines')
         # 字符集和单字码表
         file_cs1 = os.path.join(os.path.join(self.dir_charsets, 'G标'), 'GB18030汉字集_无兼容汉字.txt')
         file_cs2 = os.path.join(os.path.join(self.dir_charsets, 'G标_通规'), '通规（8105字）.txt')
-        self.set_chars = get_charset(file_cs1, file_cs2)
-        self.set_chars.add("〇")  # 该字被收录到符号区，但应作为汉字使用，故加之
+        self.dir_cache = os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'cache')
+        if not os.path.exists(self.dir_cache):
+            os.makedirs(self.dir_cache)
+        self.set_chars = self.load_charset(file_cs1, file_cs2)
+        self.pattern_chars = compile_charset_pattern(self.set_chars)
         self.file_mapping = os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'mapping_table.txt')
+        self.kind_mapping = "mapping"  # 映射表的缓存类别(多方案对比时各方案单独一类, 互不挤掉)
         self.dict_char_code = {}
         self.set_chars_user = set()
         # 统计结果
         self.file_stats = os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'statistics.txt')
+        self.dict_lines_out = {}  # 文章名: 输出行(仅保存在内存中的模拟结果)
+        # 以往的模拟结果(按 Rime 部署结果区分), 重跑时只模拟新的或有变化的句子
+        self.file_store = os.path.join(self.dir_cache, 'results.sqlite3')
+        self.store = None
+        self.dedup = None  # 本次模拟中重复的句子只模拟一次(随复用选项开启)
+        # 错字的错误模式索引(可跨多次运行查询), 只在加 --errors 参数运行时建立
+        self.file_errors = os.path.join(self.dir_cache, 'errors.sqlite3')
+        self.index_errors = False
+        self.errors = None
+        # 逐句上屏耗时(开启耗时分析时为 LatencyStats)
+        self.file_latency = os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'latency.txt')
+        self.latency = None
         # pingyin only
         self.dir_dict_yamls = os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'dict_yamls')
         self.file_mapping_sup = os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'mapping_table_sup.txt')
         self.dict_char_code_duoyin = {} # for pingyin
         self.dict_char_words_duoyin = {} # for pingyin
         self.list_matched_duoyin = []
+        self.matcher_duoyin = None
         self.file_matched_duoyin = os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'matched_duoyin.txt')
+        # 手感指标: 内置 QWERTY 布局和四项指标, 可另加布局文件和附加指标
+        self.dir_layouts = os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'layouts')
+        self.file_perf_metrics = os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'perf_metrics.txt')
+        self.perf_engine = None  # 首次统计时创建
+        self.perf_layouts_all = None  # 全部文章的各布局指标合计
 
         # 3.初始化：创建/清空相关文件夹
         if len([f for f in os.listdir(self.dir_articles) if f.endswith(".txt")]) == 0:
@@ -92,26 +131,73 @@ class AutoRime:
                 os.makedirs(d)
             for fname in os.listdir(d):
                 os.remove(os.path.join(d, fname))
-        if os.path.exists(self.file_stats):
-            os.remove(self.file_stats)
+        for file in [self.file_stats, self.file_latency]:
+            if os.path.exists(file):
+                os.remove(file)
         if os.path.exists(self.file_matched_duoyin):
             os.remove(self.file_matched_duoyin)
         if os.path.exists(self.file_mapping_sup):
             os.remove(self.file_mapping_sup)
+        # 部署 Rime(后台进行, 模拟前再等待完成; 只算手感指标时不需要部署)
+        self.deployer = DeployManager(self.file_exe_deployer, self.dir_schema,
+                                      os.path.join(self.dir_cache, 'deploy_fingerprint.txt'),
+                                      os.path.join(self.dir_cache, 'deploy.log'))
+        if deploy:
+            self.deployer.start()
         # 读取映射表
+        self.load_mapping()
+
+    def load_charset(self, *files) -> set[str]:
+        """ 读取字符集, 文件内容不变时直接使用缓存 """
+        key = hash_files(*files)
+        self.key_charset = key
+        set_chars = load_cache(self.dir_cache, "charset", key)
+        if set_chars is None:
+            set_chars = get_charset(*files)
+            set_chars.add("〇")  # 该字被收录到符号区，但应作为汉字使用，故加之
+            save_cache(self.dir_cache, "charset", key, set_chars)
+        return set_chars
+
+    def load_mapping(self):
+        """ 读取(拼音方案则先生成)映射表, 输入文件和选项不变时直接使用缓存 """
         if not self.pingyin_flg:
-            self.read_mapping_table()
-        else:
-            generate_mapping_table_pingyin(self.dir_dict_yamls, self.file_mapping, self.file_mapping_sup, self.len_code)
-            self.read_mapping_table_pingyin()
-        # 部署 Rime
-        try:
-            if sys.platform == 'win32':
-                subprocess.run(f'''cd "{self.dir_schema}" && "{self.file_exe_deployer}" --build''', shell=True, check=True)
+            key = hash_files(self.file_mapping)
+            self.key_mapping = key
+            cache = load_cache(self.dir_cache, self.kind_mapping, key)
+            if cache is None:
+                self.read_mapping_table()
+                save_cache(self.dir_cache, self.kind_mapping, key, self.dict_char_code)
             else:
-                subprocess.run(['cd', self.dir_schema, '&&', self.file_exe_deployer, '--build'], shell=True, check=True)
-        except subprocess.CalledProcessError as e:
-            raise BaseException(f"Rime 部署失败: {str(e)}")
+                self.dict_char_code = cache
+                self.set_chars_user = set(cache)
+            return
+        files = [os.path.join(self.dir_dict_yamls, fname) for fname in os.listdir(self.dir_dict_yamls) if fname.endswith(".dict.yaml")]
+        key = hash_files(*files, extra=f"len_code={self.len_code},low_memory={self.low_memory}")
+        self.key_mapping = key
+        cache = load_cache(self.dir_cache, "mapping_pingyin", key)
+        if cache is None:
+            generate_mapping_table_pingyin(self.dir_dict_yamls, self.file_mapping, self.file_mapping_sup, self.len_code,
+                                           self.low_memory, self.num_workers)
+            self.read_mapping_table_pingyin()
+            cache = {"dict_char_code": self.dict_char_code,
+                     "dict_char_code_duoyin": self.dict_char_code_duoyin,
+                     "dict_char_words_duoyin": self.dict_char_words_duoyin,
+                     "matcher_duoyin": self.matcher_duoyin}
+            for kind, file in [("text_mapping", self.file_mapping), ("text_mapping_sup", self.file_mapping_sup)]:
+                with open(file, 'rb') as fr:
+                    cache[kind] = fr.read()
+            save_cache(self.dir_cache, "mapping_pingyin", key, cache)
+        else:
+            print("映射表未变化, 使用缓存")
+            self.dict_char_code = cache["dict_char_code"]
+            self.set_chars_user = set(self.dict_char_code)
+            self.dict_char_code_duoyin = cache["dict_char_code_duoyin"]
+            self.dict_char_words_duoyin = cache["dict_char_words_duoyin"]
+            self.matcher_duoyin = cache["matcher_duoyin"]
+            # 映射表文件仍写出一份, 便于查看
+            for kind, file in [("text_mapping", self.file_mapping), ("text_mapping_sup", self.file_mapping_sup)]:
+                with open(file, 'wb') as fw:
+                    fw.write(cache[kind])
 
     def read_mapping_table(self):
         # 读取单字码表(映射表)
@@ -133,280 +219,624 @@ class AutoRime:
                 char, code, words_str = line.strip().split("\t")
                 self.dict_char_code_duoyin[char] = code
                 self.dict_char_words_duoyin[char] = sorted(words_str.split(","), key=lambda x: len(x), reverse=False)
+        self.matcher_duoyin = DuoyinMatcher(self.dict_char_words_duoyin)
 
-    def process_article(self, fname):
+    def iter_sentences(self, fname, fw_pre=None):
+        """ 逐句读取文章, 产出可用于跟打的短句(fw_pre 不为空时同时写出预处理结果) """
         file_in = os.path.join(self.dir_articles, fname)
+        with open(file_in, 'r', encoding='utf-8') as fr:
+            yield from self.iter_text_sentences(fr, fw_pre)
+
+    def iter_text_sentences(self, fr, fw_pre=None):
+        for line in iter_runs(fr, self.pattern_chars):
+            if fw_pre:
+                fw_pre.write(line+"\n")
+            if len(line) >= self.len_min and self.set_chars_user.issuperset(line):
+                yield line
+
+    def process_article(self, fname):
         file_pre = os.path.join(self.dir_articles_pre, fname)
         file_out = os.path.join(self.dir_articles_ready, fname)
-        pre_buffer = "" # for file_pre
-        line_buffer = "" # for file_out
-        out_buffer = "" # for file_out
-        with open(file_in, 'r', encoding='utf-8') as fr:
-            inline_flag = False
-            line_out_flag = True # for file_out
-            for char in fr.read():
-                if char in self.set_chars:
-                    pre_buffer += char
-                    inline_flag = True
-                    # for file_out
-                    line_buffer += char
-                    if char not in self.set_chars_user:
-                        line_out_flag = False
-                else:
-                    if inline_flag:
-                        pre_buffer += "\n"
-                        # for file_out
-                        if line_out_flag and len(line_buffer) >= self.len_min:
-                            out_buffer += (line_buffer+"\n")
-                        line_out_flag = True
-                        line_buffer = ""
-                        inline_flag = False
-                    continue
-        with open(file_pre, 'w', encoding='utf-8') as fw:
-            fw.write(pre_buffer)
-            if not pre_buffer.endswith("\n"):
-                fw.write("\n")
-        with open(file_out, 'w', encoding='utf-8') as fw:
-            fw.write(out_buffer)
-            if not out_buffer.endswith("\n"):
-                fw.write("\n")
+        with open(file_pre, 'w', encoding='utf-8') as fw_pre:
+            with open(file_out, 'w', encoding='utf-8') as fw:
+                for line in self.iter_sentences(fname, fw_pre):
+                    fw.write(line+"\n")
+
+    def code_sentence(self, fname, line) -> str:
+        """ 生成短句编码(末尾加 1 表示选首选上屏) """
+        if not self.pingyin_flg:
+            # 常规形码方案：按字查表
+            return encode_line(line, self.dict_char_code) + "1"
+        else:
+            # 拼音方案：先整句匹配多音字所在的词, 再按字查表
+            list_code, dict_pos_word = self.code_chars(line)
+            for i in dict_pos_word:
+                self.list_matched_duoyin.append((fname, line, dict_pos_word[i], line[i], list_code[i]))
+            return "".join(list_code) + "1"
+
+    def code_chars(self, line) -> tuple[list[str], dict]:
+        """ 短句各字的编码, 以及(拼音方案)多音字位置: 所在的词 """
+        if not self.pingyin_flg:
+            return [self.dict_char_code[char] for char in line], {}
+        list_code = []
+        dict_pos_word = self.matcher_duoyin.match(line)
+        for i, char in enumerate(line):
+            if char not in self.dict_char_code:
+                raise UnicodeError("该字符的编码不存在："+char)
+            list_code.append(self.dict_char_code_duoyin[char] if i in dict_pos_word else self.dict_char_code[char])
+        return list_code, dict_pos_word
 
     def generate_stdin_file(self, fname):
         # 生成短句编码
         file_in = os.path.join(self.dir_articles_ready, fname)
         file_out = os.path.join(self.dir_in, fname)
-        text_buffer = ""
         with open(file_in, 'r', encoding='utf-8') as fr:
-            if not self.pingyin_flg:
-                # 常规形码方案：按字扫描
-                for char in fr.read():
-                    if char in self.dict_char_code:
-                        text_buffer += self.dict_char_code[char]
-                    elif char == "\n":
-                        text_buffer += "1\n"
-                    else:
-                        raise UnicodeError("该字符的编码不存在："+char)
-            else:
-                # 拼音方案：按行再按字扫描
+            with open(file_out, 'w', encoding='utf-8') as fw:
                 for line in fr:
-                    line = line.strip()
-                    for i in range(len(line)):
-                        char = line[i]
-                        if char in self.dict_char_code:
-                            if char not in self.dict_char_code_duoyin:
-                                # 不是多音字
-                                text_buffer += self.dict_char_code[char]
-                            else:
-                                # 是多音字
-                                match_flg = False
-                                for word in self.dict_char_words_duoyin[char]:
-                                    # 1.在短句中查找该(特别读音的)词
-                                    start = line.find(word)
-                                    if start > -1:
-                                        # 2.在句中找到词(可能找到多个)
-                                        parts = line.split(word)
-                                        for j in range(1, len(parts), 1):
-                                            # 3.判断字和词的位置是否匹配
-                                            len_start = len("".join(parts[:j])) + len(word)*(j-1)
-                                            len_end = len_start + len(word)
-                                            if len_start <= i and i < len_end:
-                                                match_flg = True
-                                                code = self.dict_char_code_duoyin[char]
-                                                text_buffer += code
-                                                self.list_matched_duoyin.append((fname, line, word, char, code))
-                                                break
-                                    if match_flg:
-                                        break
-                                        # if len(parts) == 2:
-                                        #     # 逻辑待完善
-                                        #     match_flg = True
-                                        #     text_buffer += self.dict_char_code_duoyin[char]
-                                        #     print(line, char, word)
-                                        #     break
-                                if not match_flg:
-                                    text_buffer += self.dict_char_code[char]
-                        else:
-                            raise UnicodeError("该字符的编码不存在："+char)
-                    text_buffer += "1\n"
-        with open(file_out, 'w', encoding='utf-8') as fw:
-            fw.write(text_buffer)
-            fw.write("\nexit\n")
-        if self.pingyin_flg:
-            with open(self.file_matched_duoyin, 'w', encoding='utf-8') as fa:
-                for t in self.list_matched_duoyin:
-                    fa.write(f"{t[0]}\t{t[1]}\t{t[2]}\t{t[3]}({t[4]})\n")
-
-    def simulate(self, fname, is_final: bool=False):
-        file_stdin = os.path.join(self.dir_in, fname)
-        file_stdout = os.path.join(self.dir_out, fname)
-        if os.path.exists(file_stdout):
-            os.remove(file_stdout)
-        # 0.预处理
-        if is_final:
-            # (sup) 补充退出命令
-            with open(file_stdin, 'a', encoding='utf-8') as fa:
-                fa.write("\nexit\n")
-            print("正在模拟跟打：", self.fname_sup+" [程序自动生成]", flush=True)
+                    fw.write(self.code_sentence(fname, line.strip())+"\n")
+                fw.write("\nexit\n")
+
+    def prepare_articles(self, fnames: list[str]):
+        """ 各文章的预处理和编码生成并行进行, 识别出的多音字按文章顺序合并 """
+        if self.num_workers == 1 or len(fnames) <= 1:
+            list_matched = [_prepare_article(fname, self) for fname in fnames]
         else:
-            print("正在模拟跟打：", fname, flush=True)
-        
-        # 计算总行数
-        total_lines = 0
-        with open(file_stdin, 'r', encoding='utf-8') as fr:
-            total_lines = sum(1 for line in fr if line.strip() and line.strip() != "exit")
-        
-        # 1.开始模拟
+            # 码表等只读数据在子进程启动时传入一次(fork 时直接继承), 不随每篇文章重复序列化
+            with ProcessPoolExecutor(max_workers=min(self.num_workers or os.cpu_count() or 1, len(fnames)),
+                                     initializer=_init_prepare, initargs=(self,)) as executor:
+                list_matched = list(executor.map(_prepare_article, fnames))
+        for matched in list_matched:
+            self.list_matched_duoyin += matched
+        if self.pingyin_flg:
+            self.save_matched_duoyin()
+
+    def __getstate__(self):
+        # 传给子进程时不带后台部署、结果库等运行时对象
+        state = self.__dict__.copy()
+        for attr in ["deployer", "store", "dedup", "errors", "perf_engine"]:
+            state[attr] = None
+        return state
+
+    def save_matched_duoyin(self):
+        with open(self.file_matched_duoyin, 'w', encoding='utf-8') as fa:
+            for t in self.list_matched_duoyin:
+                fa.write(f"{t[0]}\t{t[1]}\t{t[2]}\t{t[3]}({t[4]})\n")
+
+    def simulate_all(self, fnames: list[str]):
+        """ 全部文章的编码合并后交给多个 Rime 进程并行模拟, 再按文章拆分写回输出 """
+        lines_in = []
+        lines_code = []
+        list_cnt = []
+        lines_out = []
+        for fname in fnames:
+            with open(os.path.join(self.dir_articles_ready, fname), 'r', encoding='utf-8') as fr:
+                lines_in += [line.strip() for line in fr]
+            with open(os.path.join(self.dir_in, fname), 'r', encoding='utf-8') as fr:
+                codes = [line.strip() for line in fr if line.strip() and line.strip() != "exit"]
+            lines_code += codes
+            list_cnt.append(len(codes))
+        engine = self.create_engine()
+        print(f"正在模拟跟打：{len(fnames)} 篇文章, {engine.desc}", flush=True)
+        # 按文章拆分输出(乱码行已在模拟时重试过, 仍为乱码的按错字统计; 动态库直接调用时结果只保存在内存中)
+        # 引擎只产出核对过的结果(rime_api_console 逐批核对上屏数, 动态库逐句调用), 每篇文章的结果一齐即写出并记入断点:
+        # 中途出错(如某句没有上屏)时, 已记入断点的文章都与输入对齐, 续跑时不必重跑
+        list_ranges = []
+        n = 0
+        for fname, cnt in zip(fnames, list_cnt):
+            list_ranges.append((fname, n, n+cnt))
+            n += cnt
+        list_ranges.reverse()
+
+        def flush():
+            while list_ranges and list_ranges[-1][2] <= len(lines_out):
+                fname, start, end = list_ranges.pop()
+                self.save_output(engine, fname, lines_in[start:end], lines_code[start:end], lines_out[start:end])
+
+        fnames_line = (fname for fname, cnt in zip(fnames, list_cnt) for _ in range(cnt))  # 各行所属的文章
+        start = perf_counter()
         try:
-            if sys.platform == 'win32':
-                cmd_command = f'''cd "{self.dir_schema}" && chcp 65001 && "{self.file_exe_console}" < "{file_stdin}" 2> nul | find "commit:" >> "{file_stdout}"'''
+            flush()
+            for line_out in tqdm(self.run_engine(engine, zip(lines_in, lines_code)), total=len(lines_code), desc="模拟进度", unit="行"):
+                if self.latency is not None:
+                    i = len(lines_out)
+                    self.latency.add(next(fnames_line), lines_in[i], lines_code[i], engine.latencies.popleft())
+                lines_out.append(line_out)
+                flush()
+        except Exception as e:
+            raise BaseException(f"模拟出现异常: {str(e)}")
+        engine.report()
+        self.report_store()
+        print(f"  合计: {len(lines_out)} 行, {round(len(lines_out) / max(perf_counter() - start, 1e-6), 1)} 行/秒")
+        self.output_latency()
+        cnt_garbled = sum(1 for t in lines_out if t is not None and "\ufffd" in t)
+        if cnt_garbled:
+            print(f"WARNING: 有 {cnt_garbled} 个乱行重试后仍未正常上屏")
+
+    def save_output(self, engine, fname, lines_in, codes, lines_out):
+        """ 写出一篇文章的模拟结果, 并记入断点(尚无统计结果) """
+        if isinstance(engine, LibrimeEngine):
+            self.dict_lines_out[fname] = [f"commit: {t}" if t else "" for t in lines_out]
+        else:
+            with open(os.path.join(self.dir_out, fname), 'w', encoding='utf-8') as fw:
+                for line_out in lines_out:
+                    fw.write(f"commit: {line_out}\n" if line_out else "\n")
+        self.checkpoint.save(fname, self.article_key(fname), {
+            "lines_in": lines_in, "codes": codes, "commits": lines_out, "stats": None, "unmatched": "",
+            "duoyin": [t for t in self.list_matched_duoyin if t[0] == fname]})
+
+    def complete_checkpoint(self, fname, stats):
+        """ 统计完成后把统计结果和未匹配的行记入断点 """
+        key = self.article_key(fname)
+        data = self.checkpoint.load(fname, key)
+        if data is None:
+            return
+        data["stats"] = list(stats)
+        file_unmatched = os.path.join(self.dir_unmatched, fname)
+        if os.path.exists(file_unmatched):
+            with open(file_unmatched, 'r', encoding='utf-8') as fr:
+                data["unmatched"] = fr.read()
+        self.checkpoint.save(fname, key, data)
+
+    def resume_articles(self, fnames: list[str]):
+        """ 续跑: 已完成的文章恢复未匹配的行, 已模拟未统计的文章恢复输入输出文件, 两者都恢复识别出的多音字
+        返回 ({文章名: 统计结果}, [已模拟未统计的文章]) """
+        dict_done = {}
+        fnames_simulated = []
+        for fname in fnames:
+            data = self.checkpoint.load(fname, self.article_key(fname))
+            if data is None:
+                continue
+            if data["stats"] is not None:
+                if data["unmatched"]:
+                    with open(os.path.join(self.dir_unmatched, fname), 'w', encoding='utf-8') as fw:
+                        fw.write(data["unmatched"])
+                dict_done[fname] = tuple(data["stats"])
             else:
-                # Mac/Linux 版本
-                cmd_command = f'''cd "{self.dir_schema}" && "{self.file_exe_console}" < "{file_stdin}" 2>/dev/null | grep "commit:" >> "{file_stdout}"'''
-            
-            process = subprocess.Popen(cmd_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-            
-            # 使用tqdm显示进度
-            with tqdm(total=total_lines, desc="模拟进度", unit="行") as pbar:
-                while True:
-                    if os.path.exists(file_stdout):
-                        try:
-                            with open(file_stdout, 'r', encoding='utf-8', errors='ignore') as fr:
-                                current_lines = sum(1 for line in fr if line.strip().startswith("commit:"))
-                                pbar.update(current_lines - pbar.n)
-                        except Exception:
-                            # 如果文件读取失败，继续等待
-                            pass
-                    if process.poll() is not None:
-                        break
-                    sleep(0.1)
-            
-            stdout, stderr = process.communicate()
-            
-            if process.returncode != 0:
-                raise subprocess.CalledProcessError(process.returncode, cmd_command)
-            
-            # 过滤并打印输出
-            for line in stdout.splitlines():
-                if ("code page" not in line) and ("活动代码页" not in line):
-                    print(line.rstrip())
-                    
-        except subprocess.CalledProcessError as e:
+                with open(os.path.join(self.dir_articles_ready, fname), 'w', encoding='utf-8') as fw:
+                    fw.write("".join(line+"\n" for line in data["lines_in"]))
+                with open(os.path.join(self.dir_in, fname), 'w', encoding='utf-8') as fw:
+                    fw.write("".join(code+"\n" for code in data["codes"]) + "\nexit\n")
+                with open(os.path.join(self.dir_out, fname), 'w', encoding='utf-8') as fw:
+                    fw.write("".join(f"commit: {t}\n" if t else "\n" for t in data["commits"]))
+                fnames_simulated.append(fname)
+            self.list_matched_duoyin += [tuple(t) for t in data["duoyin"]]
+        return dict_done, fnames_simulated
+
+    def discard_checkpoint(self, fname):
+        """ 统计出错的文章删除断点, 续跑时重新模拟 """
+        if os.path.exists(self.checkpoint.file(fname)):
+            os.remove(self.checkpoint.file(fname))
+
+    def article_key(self, fname, *options) -> str:
+        """ 文章及模拟条件(选项、字符集、映射表、Rime 部署结果)的摘要, 用于断点和分片进度的校验 """
+        return input_key(os.path.join(self.dir_articles, fname), STATS_VERSION, self.len_min, self.len_code, self.pingyin_flg,
+                         self.key_charset, self.key_mapping, self.build_key(), *options)
+
+    def build_key(self) -> str:
+        """ Rime 部署结果的摘要(等待部署完成) """
+        if self.key_build is None:
+            self.deployer.wait()
+            self.key_build = hash_dir(os.path.join(self.dir_schema, 'build'))
+        return self.key_build
+
+    def run_engine(self, engine, pairs):
+        """ pairs 为 (短句, 编码) 的迭代器, 按顺序产出上屏结果; 开启复用时重复的句子只模拟一次, 且只模拟新的或有变化的句子
+        (耗时分析时不复用, 每句都要实际输入) """
+        if not self.incremental or self.latency is not None:
+            return engine.run(code for _, code in pairs)
+        if self.store is None:
+            self.store = ResultStore(self.file_store, hash_dir(os.path.join(self.dir_schema, 'build')))
+        if self.dedup is None:
+            self.dedup = Dedup()
+        return self.dedup.run(lambda pairs_unique: self.store.run(engine, pairs_unique), pairs)
+
+    def report_store(self):
+        if self.dedup is not None:
+            self.dedup.report()
+            self.dedup = None
+        if self.store is not None:
+            self.store.report()
+            self.store.cnt_hit, self.store.cnt_miss = 0, 0
+
+    def create_engine(self):
+        """ 按选项创建模拟引擎, 动态库不可用时退回 rime_api_console """
+        self.deployer.wait()
+        if self.latency is not None:
+            # 耗时分析只能逐句调用动态库: rime_api_console 的输出带缓冲成批到达, 测不出逐句耗时
+            try:
+                engine = LibrimeEngine(find_librime(self.dir_librime), self.dir_schema)
+            except OSError as e:
+                raise BaseException(f"上屏耗时分析需要 librime 动态库: {str(e)}")
+            engine.profile = True
+            return engine
+        if self.backend == "librime":
+            try:
+                return LibrimeEngine(find_librime(self.dir_librime), self.dir_schema)
+            except OSError as e:
+                print(f"WARNING: {str(e)}, 改用 rime_api_console 模拟")
+        # 各进程的用户目录按方案文件和部署结果复用, 不必每次模拟都整个拷贝
+        key_schema = f"{self.deployer.fp or self.deployer.fingerprint()}|{self.build_key()}"
+        return ConsolePool(self.file_exe_console, self.dir_schema, self.dir_workers, self.num_workers, key_schema=key_schema)
+
+    def simulate_stream(self, fnames: list[str], debug: bool=False):
+        """ 流式模拟: 文章→编码→Rime→统计, 逐句流转而不落地中间文件(debug 时才写出) """
+        deque_meta = deque()  # (文章名, 短句, 编码), 与模拟结果一一对应
+        cnt_garbled = 0
+
+        def iter_codes():
+            for fname in fnames:
+                if debug:
+                    with open(os.path.join(self.dir_articles_pre, fname), 'w', encoding='utf-8') as fw_pre, \
+                         open(os.path.join(self.dir_articles_ready, fname), 'w', encoding='utf-8') as fw_ready, \
+                         open(os.path.join(self.dir_in, fname), 'w', encoding='utf-8') as fw_in:
+                        for line in self.iter_sentences(fname, fw_pre):
+                            code = self.code_sentence(fname, line)
+                            fw_ready.write(line+"\n")
+                            fw_in.write(code+"\n")
+                            deque_meta.append((fname, line, code))
+                            yield line, code
+                        fw_in.write("\nexit\n")
+                else:
+                    for line in self.iter_sentences(fname):
+                        code = self.code_sentence(fname, line)
+                        deque_meta.append((fname, line, code))
+                        yield line, code
+
+        def finish(fname, stats, text_unmatched, fw_out):
+            if fw_out:
+                fw_out.close()
+            if text_unmatched:
+                with open(os.path.join(self.dir_unmatched, fname), 'w', encoding='utf-8') as fw:
+                    fw.write("".join(text_unmatched))
+            self.flush_errors(fname)
+            stats = stats.totals()
+            self.output_result(stats, fname)
+            for i in range(6):
+                stats_all[i] += stats[i]
+
+        engine = self.create_engine()
+        print(f"正在流式模拟跟打：{len(fnames)} 篇文章, {engine.desc}", flush=True)
+        stats_all = [0, 0, 0, 0, 0, 0]
+        fname_cur, stats, text_unmatched, fw_out = None, None, None, None
+        try:
+            for line_out in tqdm(self.run_engine(engine, iter_codes()), desc="模拟进度", unit="行"):
+                fname, line_in, code = deque_meta.popleft()
+                if self.latency is not None:
+                    self.latency.add(fname, line_in, code, engine.latencies.popleft())
+                if fname != fname_cur:
+                    if fname_cur is not None:
+                        finish(fname_cur, stats, text_unmatched, fw_out)
+                    fname_cur, stats, text_unmatched = fname, SentenceStats(), []
+                    fw_out = open(os.path.join(self.dir_out, fname), 'w', encoding='utf-8') if debug else None
+                if fw_out:
+                    fw_out.write(f"commit: {line_out}\n" if line_out else "\n")
+                text = self.add_sentence_stats(stats, line_in, code, line_out, fname)
+                if text:
+                    text_unmatched.append(text)
+                    cnt_garbled += "\ufffd" in line_out
+        except UnicodeError:
+            raise
+        except Exception as e:
             raise BaseException(f"模拟出现异常: {str(e)}")
+        if fname_cur is not None:
+            finish(fname_cur, stats, text_unmatched, fw_out)
+        engine.report()
+        self.report_store()
+        if cnt_garbled:
+            print(f"WARNING: 有 {cnt_garbled} 个乱行重试后仍未正常上屏")
+        self.output_latency()
+        if self.pingyin_flg:
+            self.save_matched_duoyin()
+        self.output_result(stats_all)
+
+    def add_sentence_stats(self, stats: SentenceStats, line_in, code, line_out, fname, part: int=-1) -> str:
+        """ 逐句统计(同 get_statistics), 未匹配时(建立索引时)记入错误模式索引, 并返回写入 unmatched_lines 的一行 """
+        stats.add(line_in, code, line_out)
+        if not line_out or line_in == line_out:
+            return ""
+        if self.index_errors:
+            # 沿用统计时算出的编辑距离, 对齐只在对角带内计算
+            self.error_index().add(fname, line_in, line_out, self.code_chars(line_in)[0], part, stats.dist[-1])
+        return f"{line_in}\t{line_out}\n"
+
+    def error_index(self) -> ErrorIndex:
+        """ 错误模式索引, 按运行条件(选项、字符集、映射表、Rime 部署结果)区分 """
+        if self.errors is None:
+            key = hash_files(extra=f"{self.len_min}|{self.len_code}|{self.pingyin_flg}|{self.key_charset}|{self.key_mapping}|{self.build_key()}")
+            desc = f"{'拼音' if self.pingyin_flg else '形码'}, len_min={self.len_min}, len_code={self.len_code}"
+            self.errors = ErrorIndex(self.file_errors, key, desc)
+        return self.errors
+
+    def flush_errors(self, fname, part: int=-1):
+        """ 写入一篇文章(或一个分片)的错误模式, 不建立索引时什么都不做 """
+        if self.index_errors:
+            self.error_index().flush(fname, part)
+
+    def simulate_sharded(self, fnames: list[str], size_shard: int=SIZE_SHARD):
+        """ 分片模式: 文章按固定大小的分片读取、编码、模拟和统计, 内存占用与文章大小无关
+        每完成一片即记录进度(auto_rime/shards), 中断后重跑时跳过已完成的分片 """
+        engine = self.create_engine()
+        list_jobs = []  # (文章名, 进度记录, 分片结果文件夹)
+        for fname in fnames:
+            dir_shard = os.path.join(self.dir_shards, os.path.splitext(fname)[0])
+            if not os.path.exists(dir_shard):
+                os.makedirs(dir_shard)
+            manifest = ShardManifest(os.path.join(dir_shard, 'manifest.json'), self.article_key(fname, size_shard))
+            if self.index_errors and not manifest.dict_done:
+                self.error_index().clear(fname)
+            list_jobs.append((fname, manifest, dir_shard))
+        deque_meta = deque()  # (分片, 短句, 编码), 与模拟结果一一对应
+        deque_empty = deque()  # 没有可跟打短句的分片
+        cnt_garbled = 0
+
+        def iter_codes():
+            for fname, manifest, dir_shard in list_jobs:
+                file_in = os.path.join(self.dir_articles, fname)
+                for idx, start, end in iter_shard_ranges(file_in, size_shard, self.pattern_chars):
+                    if manifest.is_done(idx):
+                        continue
+                    lines = list(self.iter_text_sentences(io.StringIO(read_shard(file_in, start, end))))
+                    codes = [self.code_sentence(fname, line) for line in lines]
+                    shard = {"fname": fname, "manifest": manifest, "dir": dir_shard, "idx": idx, "start": start, "end": end,
+                             "cnt": len(lines), "stats": SentenceStats(), "unmatched": [], "duoyin": self.list_matched_duoyin}
+                    self.list_matched_duoyin = []
+                    if not lines:
+                        deque_empty.append(shard)
+                    for line, code in zip(lines, codes):
+                        deque_meta.append((shard, line, code))
+                        yield code
+
+        def finish(shard):
+            # 分片的未匹配行和多音字单独成文件, 统计结果记入进度
+            # (引擎只产出核对过的结果, 中途出错时已记为完成的分片都与输入对齐, 重跑时可放心跳过)
+            for suffix, lines in [("unmatched", shard["unmatched"]),
+                                  ("duoyin", [f"{t[0]}\t{t[1]}\t{t[2]}\t{t[3]}({t[4]})\n" for t in shard["duoyin"]])]:
+                file_part = os.path.join(shard["dir"], f"{shard['idx']:06d}.{suffix}.txt")
+                if lines:
+                    with open(file_part, 'w', encoding='utf-8') as fw:
+                        fw.write("".join(lines))
+                elif os.path.exists(file_part):
+                    os.remove(file_part)
+            self.flush_errors(shard["fname"], shard["idx"])
+            shard["manifest"].complete(shard["idx"], shard["start"], shard["end"], list(shard["stats"].totals()))
+
+        print(f"正在分片模拟跟打：{len(fnames)} 篇文章, {engine.desc}", flush=True)
+        try:
+            for line_out in tqdm(engine.run(iter_codes()), desc="模拟进度", unit="行"):
+                shard, line_in, code = deque_meta.popleft()
+                if self.latency is not None:
+                    self.latency.add(shard["fname"], line_in, code, engine.latencies.popleft())
+                text = self.add_sentence_stats(shard["stats"], line_in, code, line_out, shard["fname"], shard["idx"])
+                if text:
+                    shard["unmatched"].append(text)
+                    cnt_garbled += "\ufffd" in line_out
+                shard["cnt"] -= 1
+                if shard["cnt"] == 0:
+                    finish(shard)
+                while deque_empty:
+                    finish(deque_empty.popleft())
+        except UnicodeError:
+            raise
         except Exception as e:
-            raise BaseException(f"模拟过程中出现错误: {str(e)}")
-        # 2.收集输出的乱码行
-        set_n = set()
-        with open(file_stdout, 'r', encoding='utf-8') as fr:
-            n = 0
-            for line in fr:
-                n += 1
-                if "\ufffd" in line:
-                    set_n.add(n)
-        if is_final and set_n:
-            print(f"WARNING: 仍有 {len(set_n)} 个乱行未处理")
-        elif (not is_final) and set_n:
-            file_origin = os.path.join(self.dir_articles_ready, fname)
-            with open(self.file_ready_sup, 'a', encoding='utf-8') as fa:
-                n = 0
-                with open(file_origin, 'r', encoding='utf-8') as fr:
-                    for line in fr:
-                        n += 1
-                        if n in set_n:
-                            fa.write(line)
-            with open(self.file_in_sup, 'a', encoding='utf-8') as fa:
-                n = 0
-                with open(file_stdin, 'r', encoding='utf-8') as fr:
-                    for line in fr:
-                        n += 1
-                        if n in set_n:
-                            fa.write(line)
-
-    def get_statistics(self, fname, dict_sup):
+            raise BaseException(f"模拟出现异常: {str(e)}")
+        while deque_empty:
+            finish(deque_empty.popleft())
+        engine.report()
+        if cnt_garbled:
+            print(f"WARNING: 有 {cnt_garbled} 个乱行重试后仍未正常上屏")
+        self.output_latency()
+        # 合并各分片的结果
+        stats_all = [0, 0, 0, 0, 0, 0]
+        with open(self.file_matched_duoyin, 'w', encoding='utf-8') if self.pingyin_flg else open(os.devnull, 'w') as fw_duoyin:
+            for fname, manifest, dir_shard in list_jobs:
+                with open(os.path.join(self.dir_unmatched, fname), 'w', encoding='utf-8') as fw:
+                    for idx in sorted(manifest.dict_done):
+                        for suffix, fw_part in [("unmatched", fw), ("duoyin", fw_duoyin)]:
+                            file_part = os.path.join(dir_shard, f"{idx:06d}.{suffix}.txt")
+                            if os.path.exists(file_part):
+                                with open(file_part, 'r', encoding='utf-8') as fr:
+                                    shutil.copyfileobj(fr, fw_part)
+                stats = manifest.stats_total()
+                self.output_result(stats, fname)
+                for i in range(6):
+                    stats_all[i] += stats[i]
+        self.output_result(stats_all)
+
+    def simulate_sample(self, fnames: list[str], size: int, width_target: float=0.0):
+        """ 抽样估计: 从 articles_ready 中按文章和字数分层抽取约 size 句模拟, 给出各项指标的 95% 置信区间
+        width_target(百分点)不为 0 时, 样本逐次加倍, 直到两项准确率的区间宽度都不超过它(或已抽完全部短句) """
+        lines_in, lines_code, keys = [], [], []
+        for fname in fnames:
+            with open(os.path.join(self.dir_articles_ready, fname), 'r', encoding='utf-8') as fr:
+                lines = [line.strip() for line in fr]
+            with open(os.path.join(self.dir_in, fname), 'r', encoding='utf-8') as fr:
+                codes = [line.strip() for line in fr if line.strip() and line.strip() != "exit"]
+            if len(lines) != len(codes):
+                raise BaseException(f"{fname} 输入行数与编码行数不相等，请检查")
+            lines_in += lines
+            lines_code += codes
+            keys += [(fname, bucket_of(len(line))) for line in lines]
+        sample = StratifiedSample(keys)
+        engine = self.create_engine()
+        print(f"正在抽样模拟跟打：{len(fnames)} 篇文章共 {len(keys)} 句, {engine.desc}", flush=True)
+        start = perf_counter()
+        while True:
+            list_idx = sample.draw(size)
+            try:
+                pairs = ((lines_in[i], lines_code[i]) for i in list_idx)
+                # 模拟结果在前: 取完后引擎还要检查各进程的输出行数
+                for line_out, i in zip(tqdm(self.run_engine(engine, pairs), total=len(list_idx), desc="模拟进度", unit="行"), list_idx):
+                    sample.add(i, lines_in[i], lines_code[i], line_out)
+            except Exception as e:
+                raise BaseException(f"模拟出现异常: {str(e)}")
+            est = sample.estimate()
+            print(f"  样本 {len(sample)} 句: 完全准确率 {round(est[0][0]*100, 2)}% ± {round(est[0][1]*100, 2)}%, "
+                  f"综合准确率 {round(est[1][0]*100, 2)}% ± {round(est[1][1]*100, 2)}%", flush=True)
+            engine.report()
+            if not width_target or len(sample) >= len(keys) or max(est[0][1], est[1][1]) * 200 <= width_target:
+                break
+            size *= 2
+        self.report_store()
+        print(f"  合计: {len(sample)} 行, {round(len(sample) / max(perf_counter() - start, 1e-6), 1)} 行/秒")
+        self.output_result_sample(est, len(sample), len(keys))
+
+    def output_result_sample(self, est, cnt_sample: int, cnt_all: int):
+        """ 输出抽样估计的结果: 估计值 ± 95% 置信区间半宽(区间) """
+        def fmt(r, h, scale, unit):
+            return f"{round(r*scale, 2)}{unit} ± {round(h*scale, 2)}{unit} ({round((r-h)*scale, 2)}{unit} ~ {round((r+h)*scale, 2)}{unit})"
+        lines = ["\n===== 抽样估计(95% 置信区间) =====", f"样本句数 / 全部句数:\t{cnt_sample} / {cnt_all}",
+                 f"完全准确率:\t{fmt(*est[0], 100, '%')}", f"综合准确率:\t{fmt(*est[1], 100, '%')}", f"平均码长：\t{fmt(*est[2], 1, '')}"]
+        with open(self.file_stats, 'a', encoding='utf-8') as fa:
+            fa.write("\n".join(lines)+"\n")
+        print("\n".join(lines))
+        print("统计结果已写入文件：", os.path.split(self.file_stats)[-1])
+
+    def for_schema(self, name: str, dir_src: str, file_mapping: str, num_workers: int):
+        """ (多方案对比)同一语料、另一方案的 AutoRime: 方案拷贝到 auto_rime/batch/<name> 单独部署, 使用各自的映射表 """
+        dir_batch = os.path.join(os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'batch'), name)
+        ar = copy.copy(self)
+        ar.name = name
+        ar.num_workers = num_workers
+        ar.dir_schema = os.path.join(dir_batch, 'Rime')
+        ar.dir_workers = os.path.join(dir_batch, 'workers')
+        ar.dir_unmatched = os.path.join(dir_batch, 'unmatched_lines')
+        if os.path.exists(ar.dir_unmatched):
+            shutil.rmtree(ar.dir_unmatched)
+        os.makedirs(ar.dir_unmatched)
+        # 保留上次部署生成的 build, 方案文件未变化时可跳过部署
+        shutil.copytree(dir_src, ar.dir_schema, dirs_exist_ok=True, ignore=shutil.ignore_patterns('build', '*.userdb'))
+        ar.file_mapping = file_mapping
+        ar.kind_mapping = f"mapping_batch_{name}"
+        ar.dict_char_code, ar.set_chars_user = {}, set()
+        ar.load_mapping()
+        ar.deployer = DeployManager(self.file_exe_deployer, ar.dir_schema, os.path.join(dir_batch, 'deploy_fingerprint.txt'),
+                                    os.path.join(dir_batch, 'deploy.log'))
+        ar.store, ar.errors, ar.key_build = None, None, None
+        ar.dict_lines_out, ar.list_matched_duoyin = {}, []
+        return ar
+
+    def simulate_batch(self, schemas: list[tuple], fnames: list[str]) -> list:
+        """ 多方案对比: 语料只预处理一次, 各方案单独部署后同时模拟同一批短句
+        短句取各方案映射表都能编码的, 保证各方案的统计对象相同; 返回 [(方案名, 统计结果)] """
+        num_workers = self.num_workers or max(1, (os.cpu_count() or 1) // len(schemas))
+        list_ar = [self.for_schema(name, dir_src, file_mapping, num_workers) for name, dir_src, file_mapping in schemas]
+        for ar in list_ar:
+            ar.deployer.start()
+        # 1.预处理(只做一次)
+        set_chars_common = set.intersection(*[ar.set_chars_user for ar in list_ar])
+        dict_lines = {}
+        for fname in fnames:
+            file_in = os.path.join(self.dir_articles, fname)
+            with open(file_in, 'r', encoding='utf-8') as fr:
+                dict_lines[fname] = [line for line in iter_runs(fr, self.pattern_chars)
+                                     if len(line) >= self.len_min and set_chars_common.issuperset(line)]
+        cnt_lines = sum(len(lines) for lines in dict_lines.values())
+        print(f"正在对比模拟跟打：{len(schemas)} 个方案, {len(fnames)} 篇文章, {cnt_lines} 个短句", flush=True)
+
+        # 2.各方案同时模拟
+        def run(i, ar):
+            engine = ar.create_engine()
+            deque_meta = deque()
+
+            def iter_codes():
+                for fname in fnames:
+                    for line in dict_lines[fname]:
+                        code = ar.code_sentence(fname, line)
+                        deque_meta.append((fname, line, code))
+                        yield code
+
+            dict_stats = {fname: SentenceStats() for fname in fnames}
+            dict_unmatched = {fname: [] for fname in fnames}
+            try:
+                for line_out in tqdm(engine.run(iter_codes()), total=cnt_lines, desc=ar.name, unit="行", position=i):
+                    fname, line_in, code = deque_meta.popleft()
+                    text = ar.add_sentence_stats(dict_stats[fname], line_in, code, line_out, fname)
+                    if text:
+                        dict_unmatched[fname].append(text)
+            except UnicodeError:
+                raise
+            except Exception as e:
+                raise BaseException(f"{ar.name} 模拟出现异常: {str(e)}")
+            stats_all = [0, 0, 0, 0, 0, 0]
+            for fname in fnames:
+                if dict_unmatched[fname]:
+                    with open(os.path.join(ar.dir_unmatched, fname), 'w', encoding='utf-8') as fw:
+                        fw.write("".join(dict_unmatched[fname]))
+                ar.flush_errors(fname)
+                stats = dict_stats[fname].totals()
+                for k in range(6):
+                    stats_all[k] += stats[k]
+            if ar.errors is not None:
+                ar.errors.close()
+            return ar.name, stats_all
+
+        with ThreadPoolExecutor(max_workers=len(list_ar)) as executor:
+            return list(executor.map(run, range(len(list_ar)), list_ar))
+
+    def output_result_batch(self, list_result: list):
+        """ 多方案对比的结果表(同 README 中测试记录的口径) """
+        file_out = os.path.join(os.path.join(os.path.join(self.dir_bundle, 'auto_rime'), 'batch'), 'comparison.txt')
+        lines = ["| 方案 | 语料句数/字数 | 完全准确率 | 综合准确率 | 平均码长 |", "| --- | --- | --- | --- | --- |"]
+        for name, stats in list_result:
+            ratio_line = round(stats[1] / stats[0] * 100, 2) if stats[0] else 0
+            ratio_char = round(stats[3] / stats[2] * 100, 2) if stats[2] else 0
+            avg_code_len = round(stats[5] / stats[4], 2) if stats[4] else 0
+            lines.append(f"| {name} | {stats[0]}/{stats[2]} | {ratio_line}% | {ratio_char}% | {avg_code_len} |")
+        with open(file_out, 'w', encoding='utf-8') as fw:
+            fw.write("\n".join(lines)+"\n")
+        print("\n" + "\n".join(lines))
+        print("对比结果已写入文件：", os.path.relpath(file_out, self.dir_bundle))
+
+    def output_latency(self):
+        """ 输出逐句上屏耗时: 全部、各篇文章、各字数分组的 p50/p90/p99/最大值(毫秒), 以及最慢的句子 """
+        if self.latency is None or not len(self.latency):
+            return
+        head = "\t句数\tp50\tp90\tp99\t最大"
+        lines = ["===== 上屏耗时(毫秒) =====", head, "全部\t" + self.format_latency(self.latency.total()),
+                 "", "文章" + head] + [f"{t[0]}\t" + self.format_latency(t[1:]) for t in self.latency.by_article()]
+        lines += ["", "字数" + head] + [f"{t[0]}\t" + self.format_latency(t[1:]) for t in self.latency.by_length()]
+        lines += ["", f"最慢的 {len(self.latency.heap_slowest)} 句", "耗时\t文章\t字数\t短句\t编码"]
+        lines += [f"{round(t[0]*1000, 2)}\t{t[1]}\t{len(t[2])}\t{t[2]}\t{t[3]}" for t in self.latency.slowest()]
+        with open(self.file_latency, 'w', encoding='utf-8') as fw:
+            fw.write("\n".join(lines)+"\n")
+        i = lines.index("")
+        print("\n" + "\n".join(lines[:i]))
+        print("各文章、各字数分组的耗时和最慢的句子已写入文件：", os.path.split(self.file_latency)[-1])
+
+    @staticmethod
+    def format_latency(res) -> str:
+        return f"{res[0]}\t" + "\t".join(str(round(v*1000, 2)) for v in res[1:])
+
+    def get_statistics(self, fname):
         file_in = os.path.join(self.dir_articles_ready, fname)
         file_code = os.path.join(self.dir_in, fname)
         file_out = os.path.join(self.dir_out, fname)
-        lines_in = []
-        lines_out = []
-        chars_cnt = 0
-        codes_len = 0
-        # 计算码长
+        # (统计前准备)读取输入、编码和输出行
         with open(file_in, 'r', encoding='utf-8') as fr:
-            for line in fr:
-                line = line.strip()
-                if line:
-                    chars_cnt += len(line)
+            lines_in = [line.strip() for line in fr]
         with open(file_code, 'r', encoding='utf-8') as fr:
-            for line in fr:
-                line = line.strip()
-                if line and line != "exit":
-                    codes_len += len(line.rstrip("1"))
-        # (统计前准备)读取输入输出行
-        with open(file_in, 'r', encoding='utf-8') as fr:
-            for line in fr:
-                lines_in.append(line.strip())
-        with open(file_out, 'r', encoding='utf-8') as fr:
-            for line in fr:
-                lines_out.append(line.strip())
+            codes = [line for line in map(str.strip, fr) if line and line != "exit"]
+        if fname in self.dict_lines_out:
+            lines_out = self.dict_lines_out[fname]
+        else:
+            with open(file_out, 'r', encoding='utf-8') as fr:
+                lines_out = [line.strip() for line in fr]
         # 开始统计
-        if len(lines_in) != len(lines_out):
+        if len(lines_in) != len(lines_out) or len(lines_in) != len(codes):
             raise BaseException(f"{fname} 输入行数与输出行数不相等，请检查")
-        else:
-            cnt_line_total, cnt_line_correct = 0, 0
-            cnt_char_total, cnt_char_correct = 0, 0
-            text_unmatched = ""
-            for i in range(len(lines_in)):
-                if lines_in[i] and lines_out[i].startswith("commit: "):
-                    line_in = lines_in[i]
-                    cnt_line_total += 1
-                    cnt_char_total += len(line_in)
-                    if line_in == lines_out[i][8:]: # 截去输出行的"commit: "前缀
-                        cnt_line_correct += 1
-                        cnt_char_correct += len(line_in)
-                    elif "\ufffd" in lines_out[i] and dict_sup: # 使用补打结果
-                        if line_in == dict_sup[line_in]:
-                            cnt_line_correct += 1
-                            cnt_char_correct += len(line_in)
-                        else:
-                            line_out = dict_sup[line_in]
-                            text_unmatched += f"{line_in}\t{line_out}\n"
-                            for j in range(len(line_in)):
-                                try:
-                                    if line_in[j] == line_out[j]:
-                                        cnt_char_correct += 1
-                                except IndexError:
-                                    break
-                    else:
-                        line_out = lines_out[i][8:]
-                        text_unmatched += f"{line_in}\t{line_out}\n"
-                        for j in range(len(line_in)):
-                            try:
-                                if line_in[j] == line_out[j]:
-                                    cnt_char_correct += 1
-                            except IndexError:
-                                break
-            # 保存未匹配的行
-            if text_unmatched:
-                with open(os.path.join(self.dir_unmatched, fname), 'w', encoding='utf-8') as fw:
-                    fw.write(text_unmatched)
-            return (cnt_line_total, cnt_line_correct, cnt_char_total, cnt_char_correct, chars_cnt, codes_len)
-
-    def load_sup_result(self) -> dict:
-        dict_result = {}
-        lines_in = []
-        lines_out = []
-        with open(self.file_ready_sup, 'r', encoding='utf-8') as fr:
-            for line in fr:
-                lines_in.append(line.strip())
-        with open(self.file_out_sup, 'r', encoding='utf-8') as fr:
-            for line in fr:
-                lines_out.append(line.strip())
-        if len(lines_in) != len(lines_out):
-            raise BaseException(f"{self.fname_sup} 输入行数与输出行数不相等，请检查")
-        else:
-            for i in range(len(lines_in)):
-                if lines_in[i] and lines_out[i].startswith("commit: "):
-                    dict_result[lines_in[i]] = lines_out[i][8:]
-        return dict_result
+        stats = SentenceStats()
+        text_unmatched = []
+        for line_in, code, line_out in zip(lines_in, codes, lines_out):
+            # 截去输出行的"commit: "前缀, 没有上屏的行记为 None
+            text = self.add_sentence_stats(stats, line_in, code, line_out[8:] if line_out.startswith("commit: ") else None, fname)
+            if text:
+                text_unmatched.append(text)
+        self.flush_errors(fname)
+        # 保存未匹配的行
+        if text_unmatched:
+            with open(os.path.join(self.dir_unmatched, fname), 'w', encoding='utf-8') as fw:
+                fw.write("".join(text_unmatched))
+        return stats.totals()
 
     def output_result(self, stats, fname: str=""):
         with open(self.file_stats, 'a', encoding='utf-8') as fa:
@@ -431,31 +861,50 @@ class AutoRime:
         """ 统计: 总字数，总码长，总互击数，总小指干扰，总大跨排，总小跨排 """
         file_in = os.path.join(self.dir_articles_ready, fname)
         file_code = os.path.join(self.dir_in, fname)
-        chars_cnt = 0
-        codes_len = 0
-        huji_cnt = 0
-        ganrao_cnt = 0
-        dkuapai_cnt = 0
-        xkuapai_cnt = 0
-        # 计算码长
-        with open(file_in, 'r', encoding='utf-8') as fr:
-            # 统计字数
-            for line in fr:
-                line = line.strip()
-                if line:
-                    chars_cnt += len(line)
-        with open(file_code, 'r', encoding='utf-8') as fr:
-            # 统计其他
-            for line in fr:
-                line = line.strip()
-                if line and line != "exit":
-                    codes_len += len(line.rstrip("1"))
-                    huji_cnt += get_hu_ji(line)
-                    ganrao_cnt += get_xzgr(line)
-                    dkuapai_cnt += get_dkp(line)
-                    xkuapai_cnt += get_xkp(line)
+        if self.perf_engine is None:
+            self.perf_engine = PerfEngine(load_layouts(self.dir_layouts), load_metrics(self.file_perf_metrics))
+        if not self.pingyin_flg:
+            # 形码方案: 由字频索引和码表直接得到按键组合的计数
+            ngrams2, ngrams3, chars_cnt, codes_len = self.load_ngrams(fname)
+            results = self.perf_engine.score(*self.perf_engine.vectorize(ngrams2, ngrams3))
+        else:
+            # 拼音方案(多音字按词定码): 统计生成的编码文件
+            with open(file_in, 'r', encoding='utf-8') as fr:
+                chars_cnt = sum(len(line.strip()) for line in fr)
+            with open(file_code, 'r', encoding='utf-8') as fr:
+                lines = [line for line in map(str.strip, fr) if line and line != "exit"]
+            codes_len = sum(len(line.rstrip("1")) for line in lines)
+            results = self.perf_engine.score_lines(lines)
+        huji_cnt, ganrao_cnt, dkuapai_cnt, xkuapai_cnt = results[0][:4]
+        # 累计各布局的全部指标, 供布局对比
+        if self.perf_layouts_all is None:
+            self.perf_layouts_all = [[0] * (len(self.perf_engine.metrics)+1) for _ in results]
+        for res_all, res in zip(self.perf_layouts_all, results):
+            for i, cnt in enumerate(res):
+                res_all[i] += cnt
+            res_all[-1] += codes_len
         return (huji_cnt, ganrao_cnt, dkuapai_cnt, xkuapai_cnt, chars_cnt, codes_len)
 
+    def load_ngrams(self, fname):
+        """ 文章的按键二元组/三元组计数, 字频索引和计数结果缓存起来, 码表只改动少量字时增量更新 """
+        file_in = os.path.join(self.dir_articles, fname)
+        key = hash_files(file_in, extra=f"{self.key_charset}|len_min={self.len_min}|{''.join(sorted(self.set_chars_user))}")
+        kind = "ngram_" + os.path.splitext(fname)[0]
+        cache = load_cache(self.dir_cache, kind, key)
+        if cache is None:
+            cache = {"index": NgramIndex(self.iter_sentences(fname)), "mapping": None, "ngrams": None}
+        index = cache["index"]
+        mapping = {char: self.dict_char_code[char] for char in index.vocab if char != "\n"}
+        if cache["mapping"] != mapping:
+            if cache["ngrams"] is None:
+                cache["ngrams"] = index.expand(mapping)
+            else:
+                cache["ngrams"] = index.update(*cache["ngrams"], cache["mapping"], mapping)
+            cache["mapping"] = mapping
+            save_cache(self.dir_cache, kind, key, cache)
+        ngrams2, ngrams3 = cache["ngrams"]
+        return ngrams2, ngrams3, index.count_chars(), index.count_codes(mapping)
+
     def output_result_perf(self, stats, fname: str=""):
         with open(self.file_stats, 'a', encoding='utf-8') as fa:
             if fname:
@@ -477,85 +926,262 @@ class AutoRime:
         if not fname:
             print("统计结果已写入文件：", os.path.split(self.file_stats)[-1])
 
+    def output_result_layouts(self):
+        """ 各布局的全部手感指标对比(键均), 只有内置布局和指标时不输出 """
+        engine = self.perf_engine
+        if engine is None or (len(engine.layouts) == 1 and len(engine.metrics) == 4):
+            return
+        lines = ["\n===== 布局对比(键均) =====", "布局\t" + ", ".join(m.name+"率" for m in engine.metrics)]
+        for layout, res in zip(engine.layouts, self.perf_layouts_all):
+            lines.append(layout.name + "\t" + ", ".join(f"{round(cnt / res[-1] * 100, 1)}%" for cnt in res[:-1]))
+        with open(self.file_stats, 'a', encoding='utf-8') as fa:
+            fa.write("\n".join(lines)+"\n")
+        print("\n".join(lines))
+
+_prepare_ar = None
+
+def _init_prepare(ar):
+    global _prepare_ar
+    _prepare_ar = ar
+
+def load_batch_list(file_batch: str) -> list[tuple]:
+    """ 读取多方案对比的方案列表: 每行 "名称<Tab>方案文件夹<Tab>映射表", # 开头为注释, 相对路径相对于列表文件 """
+    dir_base = os.path.dirname(os.path.abspath(file_batch))
+    schemas = []
+    with open(file_batch, 'r', encoding='utf-8') as fr:
+        for line in fr:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split("\t")
+            if len(parts) != 3:
+                raise BaseException(f"方案列表格式有误(应为 名称<Tab>方案文件夹<Tab>映射表)：{line}")
+            name, dir_src, file_mapping = parts
+            schemas.append((name, os.path.join(dir_base, dir_src), os.path.join(dir_base, file_mapping)))
+    if len(set(name for name, _, _ in schemas)) < len(schemas):
+        raise BaseException("方案列表中有重复的名称")
+    for name, dir_src, file_mapping in schemas:
+        if not os.path.isdir(dir_src) or not os.path.isfile(file_mapping):
+            raise BaseException(f"找不到方案 {name} 的文件夹或映射表")
+    return schemas
+
+def get_dir_bundle() -> str:
+    """ 程序根目录(当前 py 或打包后 exe 所在的目录)的绝对路径 """
+    if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
+        return os.path.split(sys._MEIPASS)[0]
+    return os.getcwd()
+
+def _prepare_article(fname, ar=None):
+    """ 预处理一篇文章并生成编码, 返回其中识别出的多音字 """
+    ar = ar or _prepare_ar
+    n = len(ar.list_matched_duoyin)
+    ar.process_article(fname)
+    ar.generate_stdin_file(fname)
+    matched = ar.list_matched_duoyin[n:]
+    del ar.list_matched_duoyin[n:]
+    return matched
+
 def main_perf():
-    # 0.初始化 Rime (包括部署)
+    # 0.初始化(手感指标不需要 Rime, 不部署)
     pingyin_flg = False
     len_min = 1
     len_code = 0
-    ar = AutoRime(pingyin_flg, len_min, len_code)  # send True if pingyin
+    ar = AutoRime(pingyin_flg, len_min, len_code, deploy=False)  # send True if pingyin
     print("开始计算手感指标……")
-    # 1.生成编码
-    for fname in os.listdir(ar.dir_articles):
-        if fname.endswith(".txt") and fname != ar.fname_sup:
-            ar.process_article(fname)
-            ar.generate_stdin_file(fname)
+    # 1.生成编码(形码方案直接由字频索引统计, 不需要生成)
+    if ar.pingyin_flg:
+        ar.prepare_articles([fname for fname in os.listdir(ar.dir_articles) if fname.endswith(".txt")])
     # 2.统计并输出结果
     print()
     stats_all = [0, 0, 0, 0, 0, 0]
     for fname in os.listdir(ar.dir_articles):
-        if fname.endswith(".txt") and fname != ar.fname_sup:
+        if fname.endswith(".txt"):
             stats = ar.get_statistics_perf(fname)
             ar.output_result_perf(stats, fname)
             for i in range(6):
                 stats_all[i] += stats[i]
     ar.output_result_perf(stats_all)
+    ar.output_result_layouts()
+
+def main_batch(file_batch: str, len_min: int=1, num_workers: int=0, index_errors: bool=False):
+    """ 多方案对比(不需要交互输入, 映射表按形码方案使用): 方案列表见 load_batch_list """
+    schemas = load_batch_list(file_batch)
+    ar = AutoRime(False, len_min, 0, num_workers, deploy=False, incremental=False)
+    ar.index_errors = index_errors
+    fnames = [fname for fname in os.listdir(ar.dir_articles) if fname.endswith(".txt")]
+    ar.output_result_batch(ar.simulate_batch(schemas, fnames))
 
-def main():
+def main_errors(k: int=20):
+    """ 查询错误模式索引: 出错最多的编码片段(汇总以往全部运行) """
+    file_errors = os.path.join(os.path.join(os.path.join(get_dir_bundle(), 'auto_rime'), 'cache'), 'errors.sqlite3')
+    if not os.path.exists(file_errors):
+        raise BaseException("还没有错误模式索引, 请先运行模拟跟打")
+    errors = ErrorIndex(file_errors)
+    print(f"出错最多的 {k} 处(汇总 {errors.count_runs()} 种运行条件)：")
+    print("次数\t编码\t输入\t错误输出")
+    for code, seg_in, seg_out, cnt in errors.top(k):
+        print(f"{cnt}\t{code}\t{seg_in}\t{seg_out}")
+    errors.close()
+
+def main_qiefen(len_max: int=0):
+    """ 切分歧义分析: 码表中键位相同而切分不同的码组, 按文章中出现的次数排序后写入 qiefen.txt """
+    ar = AutoRime(deploy=False)
+    print("正在分析切分歧义……")
+    lines = [line for fname in os.listdir(ar.dir_articles) if fname.endswith(".txt") for line in ar.iter_sentences(fname)]
+    list_ranked, cnt_amb = analyze_qiefen(ar.dict_char_code, lines, len_max, ar.num_workers)
+    file_out = os.path.join(os.path.join(ar.dir_bundle, 'auto_rime'), 'qiefen.txt')
+    save_qiefen(file_out, list_ranked, ar.dict_char_code)
+    print(f"共 {cnt_amb} 组切分歧义, 其中 {len(list_ranked)} 组在文章中出现过, 已按出现次数写入文件：", os.path.split(file_out)[-1])
+
+def main(resume: bool=False, latency_top: int=0, index_errors: bool=False):
     # 0.初始化 Rime (包括部署)
     print("欢迎使用 AutoRime 模拟跟打程序，请输入以下选项：\n")
     pingyin_flg = False
     len_min = 1
     len_code = 0
+    num_workers = 0
+    backend = "console"
+    stream_flg, debug_flg = False, False
+    shard_flg = False
+    size_sample, width_target = 0, 0.0
+    low_memory = False
+    incremental = True
     sel1 = input('[选项1]目标方案是否为拼音类方案（一字多码），回车默认N（Y/N）：')
     if sel1 and sel1 in ['Y', 'y']:
         pingyin_flg = True
+        sel1_1 = input('[选项1.1]词库较大时是否以低内存模式生成映射表（重复词条会重复计数），回车默认N（Y/N）：')
+        if sel1_1 and sel1_1 in ['Y', 'y']:
+            low_memory = True
     sel2 = input('[选项2]是否只模拟跟打 n 字及以上的短句，回车默认1（整数）：')
     if sel2 and int(sel2) > 1:
         len_min = int(sel2)
     sel3 = input('[选项3]固定模拟跟打的单字码长（适合音形、形音方案），回车默认0表示不固定码长（大于1的整数）：')
     if sel3 and int(sel3) > 1:
         len_code = int(sel3)
+    sel4 = input('[选项4]并行模拟的 Rime 进程数，回车默认0表示按 CPU 核数（整数）：')
+    if sel4 and int(sel4) > 0:
+        num_workers = int(sel4)
+    sel5 = input('[选项5]是否直接调用 librime 动态库模拟（不可用时自动改用 rime_api_console），回车默认N（Y/N）：')
+    if sel5 and sel5 in ['Y', 'y']:
+        backend = "librime"
+    sel6 = input('[选项6]是否流式模拟（边生成编码边模拟，不保存中间文件；D 表示同时保存中间文件），回车默认N（Y/N/D）：')
+    if sel6 and sel6 in ['Y', 'y', 'D', 'd']:
+        stream_flg = True
+        debug_flg = sel6 in ['D', 'd']
+    sel7 = input('[选项7]是否复用模拟结果（方案和编码都未变的句子不再重新模拟，重复的句子只模拟一次），回车默认Y（Y/N）：')
+    if sel7 and sel7 in ['N', 'n']:
+        incremental = False
+    sel8 = input('[选项8]是否分片模拟（适合 GB 级的大语料，中断后重跑可从未完成的分片续跑），回车默认N（Y/N）：')
+    if sel8 and sel8 in ['Y', 'y']:
+        shard_flg = True
+    sel9 = input('[选项9]是否抽样估计（按文章和字数分层抽取部分短句模拟，输出置信区间），回车默认0表示模拟全部（抽样句数）：')
+    if sel9 and int(sel9) > 0:
+        size_sample = int(sel9)
+        sel9_1 = input('[选项9.1]逐次加倍样本直到准确率的置信区间宽度不超过多少个百分点，回车默认0表示只抽一次（小数）：')
+        if sel9_1 and float(sel9_1) > 0:
+            width_target = float(sel9_1)
+    if latency_top and backend != "librime":
+        raise BaseException("上屏耗时分析需要直接调用 librime 动态库（选项5 选 Y）：rime_api_console 的输出成批到达，测不出逐句耗时")
     print("进入跟打模拟中……\n")
-    ar = AutoRime(pingyin_flg, len_min, len_code)  # send True if pingyin
+    ar = AutoRime(pingyin_flg, len_min, len_code, num_workers, backend, low_memory, incremental)  # send True if pingyin
+    ar.index_errors = index_errors
+    if latency_top:
+        # 耗时分析: 每句都通过 librime 动态库实际输入(不复用以往的结果), 记录各句从输入到上屏的耗时
+        ar.latency = LatencyStats(latency_top)
 
     # 1.模拟打字
-    for fname in os.listdir(ar.dir_articles):
-        if fname.endswith(".txt") and fname != ar.fname_sup:
-            ar.process_article(fname)
-            ar.generate_stdin_file(fname)
-            # sleep(1)
-            ar.simulate(fname)
-
-    # 2.补跑乱序部分
-    if os.path.exists(ar.file_in_sup):
-        # sleep(1)
-        ar.simulate(ar.fname_sup, True)
-    dict_sup = {}
-    if os.path.exists(ar.file_out_sup):
-        dict_sup = ar.load_sup_result()
+    fnames = [fname for fname in os.listdir(ar.dir_articles) if fname.endswith(".txt")]
+    if size_sample:
+        # 抽样估计: 预处理全部文章, 只模拟抽到的短句
+        ar.prepare_articles(fnames)
+        ar.simulate_sample(fnames, size_sample, width_target)
+        if ar.pingyin_flg:
+            print("自动识别的多音字已写入文件：", os.path.split(ar.file_matched_duoyin)[-1])
+        return
+    if shard_flg:
+        # 分片模拟: 按分片边模拟边统计, 可续跑
+        ar.simulate_sharded(fnames)
+        if ar.pingyin_flg:
+            print("自动识别的多音字已写入文件：", os.path.split(ar.file_matched_duoyin)[-1])
+        return
+    if stream_flg:
+        # 流式模拟: 边模拟边统计
+        ar.simulate_stream(fnames, debug_flg)
+        if ar.pingyin_flg:
+            print("自动识别的多音字已写入文件：", os.path.split(ar.file_matched_duoyin)[-1])
+        return
+    dict_done, fnames_simulated = {}, []  # 续跑时已完成的文章(及其统计结果), 已模拟未统计的文章
+    if resume:
+        dict_done, fnames_simulated = ar.resume_articles(fnames)
+        print(f"续跑: {len(dict_done)} 篇文章已完成, {len(fnames_simulated)} 篇已模拟待统计, "
+              f"{len(fnames) - len(dict_done) - len(fnames_simulated)} 篇需要模拟")
+    fnames_todo = [fname for fname in fnames if fname not in dict_done and fname not in fnames_simulated]
+    if fnames_todo:
+        ar.prepare_articles(fnames_todo)
+        ar.simulate_all(fnames_todo)
+    elif ar.pingyin_flg:
+        ar.save_matched_duoyin()
     if ar.pingyin_flg:
         print("自动识别的多音字已写入文件：", os.path.split(ar.file_matched_duoyin)[-1])
 
-    # 3.统计模拟结果
+    # 2.统计模拟结果(某篇出错时先统计其余文章, 出错的文章可用 --resume 重跑)
     print()
     stats_all = [0, 0, 0, 0, 0, 0]
-    for fname in os.listdir(ar.dir_articles):
-        if fname.endswith(".txt") and fname != ar.fname_sup:
-            stats = ar.get_statistics(fname, dict_sup)
-            ar.output_result(stats, fname)
-            for i in range(6):
-                stats_all[i] += stats[i]
-    ar.output_result(stats_all)
+    fnames_failed = []
+    for fname in fnames:
+        if fname in dict_done:
+            stats = dict_done[fname]
+        else:
+            try:
+                stats = ar.get_statistics(fname)
+            except KeyboardInterrupt:
+                raise
+            except BaseException as e:
+                print(f"ERROR: {str(e)}")
+                ar.discard_checkpoint(fname)
+                fnames_failed.append(fname)
+                continue
+            ar.complete_checkpoint(fname, stats)
+        ar.output_result(stats, fname)
+        for i in range(6):
+            stats_all[i] += stats[i]
+    if len(fnames_failed) < len(fnames):
+        ar.output_result(stats_all)
+    if fnames_failed:
+        raise BaseException(f"{len(fnames_failed)} 篇文章统计出错, 可加 --resume 参数重跑(只重新模拟这些文章)")
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # 打包成 exe 后子进程需要
+    parser = argparse.ArgumentParser(description="AutoRime 模拟跟打")
+    parser.add_argument("--resume", action="store_true", help="从断点续跑: 跳过上次已完成的文章, 只重新模拟未完成或出错的文章")
+    parser.add_argument("--errors", type=int, metavar="K",
+                        help="错误模式索引: 模拟时把错字记入索引, 结束后输出(以往各次运行中)出错最多的 K 处编码片段")
+    parser.add_argument("--latency", type=int, nargs="?", const=100, default=0, metavar="N",
+                        help="上屏耗时分析: 按文章和字数输出逐句耗时的分位数, 并导出最慢的 N 句(默认 100)到 latency.txt")
+    parser.add_argument("--qiefen", type=int, nargs="?", const=0, metavar="LEN",
+                        help="切分歧义分析: 找出总键数不超过 LEN(默认为最长码长的两倍)的歧义后退出")
+    parser.add_argument("--batch", metavar="FILE", help="多方案对比: 按方案列表文件(每行 名称<Tab>方案文件夹<Tab>映射表)逐个部署并同时模拟")
+    parser.add_argument("--len-min", type=int, default=1, help="(--batch)只模拟跟打 n 字及以上的短句")
+    parser.add_argument("--workers", type=int, default=0, help="(--batch)每个方案的 Rime 进程数, 0 表示按 CPU 核数平分")
+    args = parser.parse_args()
     try:
         start = perf_counter()
-        # main()
-        main_perf()
+        if args.batch:
+            main_batch(args.batch, args.len_min, args.workers, bool(args.errors))
+        elif args.qiefen is not None:
+            main_qiefen(args.qiefen)
+        elif args.resume or args.latency or args.errors:
+            main(args.resume, args.latency, bool(args.errors))
+        else:
+            # main()
+            main_perf()
+        if args.errors:
+            main_errors(args.errors)
         print("\nRuntime:", perf_counter() - start)
     except:
         print(traceback.format_exc())
         print("ERROR: 由于上述原因, 程序已中止运行")
     print('\n\n------------------------------------')
-    input("回车退出程序:")
+    if not args.batch:
+        input("回车退出程序:")
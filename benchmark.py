@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# 性能基准测试, 用法: python benchmark.py [测试项] [参数...]
+#   segment [MB ...]    分句+编码的耗时随文本大小的变化(默认 1 10 100 MB)
+#   duoyin              多音字匹配: 自动机与逐词查找(旧实现)的对比, 需要 auto_rime/dict_yamls
+#   mapping [exact|low] 拼音映射表生成的耗时和内存峰值(不指定时两种模式各在独立进程中跑一次)
+#   perf [万字]         手感指标: 查找表批量计算、字频索引与逐行计算(旧实现)的对比(默认 260 万字)
+#   pipeline [MB ...]   完整流程(预处理、生成编码、模拟、统计)各阶段的耗时、内存峰值和每秒句数(默认 1 4 16 MB)
+#                       用 fake_console.py 代替 rime_api_console, 不需要 librime, 结果可重复
+
+import io
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+from time import perf_counter
+from func_lib import get_charset, compile_charset_pattern, iter_runs, encode_line, get_peak_rss
+from func_lib import generate_mapping_table_pingyin, DuoyinMatcher
+from func_lib import get_hu_ji, get_xzgr, get_dkp, get_xkp
+from perf_lib import PerfEngine, NgramIndex
+
+dir_auto_rime = os.path.join(os.getcwd(), 'auto_rime')
+
+
+def load_tables():
+    """ 读取字符集和单字码表(同 AutoRime 的初始化) """
+    dir_charsets = os.path.join(dir_auto_rime, 'charsets')
+    file_cs1 = os.path.join(os.path.join(dir_charsets, 'G标'), 'GB18030汉字集_无兼容汉字.txt')
+    file_cs2 = os.path.join(os.path.join(dir_charsets, 'G标_通规'), '通规（8105字）.txt')
+    set_chars = get_charset(file_cs1, file_cs2)
+    set_chars.add("〇")
+    dict_char_code = {}
+    with open(os.path.join(dir_auto_rime, 'mapping_table.txt'), 'r', encoding='utf-8') as fr:
+        for line in fr:
+            line = line.strip()
+            if line:
+                char, code = line.split('\t')
+                dict_char_code[char] = code
+    return set_chars, dict_char_code
+
+
+def read_articles() -> str:
+    dir_articles = os.path.join(dir_auto_rime, 'articles')
+    text = ""
+    for fname in sorted(os.listdir(dir_articles)):
+        if fname.endswith(".txt"):
+            with open(os.path.join(dir_articles, fname), 'r', encoding='utf-8') as fr:
+                text += fr.read()
+    return text
+
+
+def make_corpus(file_out: str, size_mb: float, text: str):
+    """ 重复拼接样例文章, 生成指定大小的语料文件(末尾不截断字符) """
+    data = text.encode('utf-8')
+    size = int(size_mb * 1024 * 1024)
+    with open(file_out, 'wb') as fw:
+        while size > 0:
+            fw.write(data[:size].decode('utf-8', errors='ignore').encode('utf-8'))
+            size -= len(data)
+
+
+def bench_segment(*sizes_mb):
+    """ 分句+编码的线性扩展测试: 每 MB 耗时应基本不随文本增大而增加 """
+    sizes_mb = [float(s) for s in sizes_mb] or [1, 10, 100]
+    set_chars, dict_char_code = load_tables()
+    pattern = compile_charset_pattern(set_chars)
+    set_chars_user = set(dict_char_code)
+    text = read_articles()
+    list_cost = []
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        file_corpus = os.path.join(dir_tmp, 'corpus.txt')
+        for size_mb in sizes_mb:
+            make_corpus(file_corpus, size_mb, text)
+            cnt_lines, cnt_codes = 0, 0
+            start = perf_counter()
+            with open(file_corpus, 'r', encoding='utf-8', errors='ignore') as fr:
+                for line in iter_runs(fr, pattern):
+                    if set_chars_user.issuperset(line):
+                        cnt_lines += 1
+                        cnt_codes += len(encode_line(line, dict_char_code))
+            elapsed = perf_counter() - start
+            list_cost.append(elapsed / size_mb)
+            print(f"{size_mb:>8g} MB: {cnt_lines} 句, {cnt_codes} 码, {round(elapsed, 3)} 秒, {round(size_mb / elapsed, 2)} MB/秒")
+    print(f"每 MB 耗时(最大文本/最小文本): {round(list_cost[-1] / list_cost[0], 2)}")
+
+
+def match_duoyin_legacy(line: str, dict_char_words: dict) -> dict:
+    """ 旧实现: 对每个多音字逐个词 find/split 定位, 返回 {多音字位置: 匹配到的词} """
+    dict_pos_word = {}
+    for i in range(len(line)):
+        char = line[i]
+        if char not in dict_char_words:
+            continue
+        for word in dict_char_words[char]:
+            if line.find(word) > -1:
+                parts = line.split(word)
+                for j in range(1, len(parts), 1):
+                    len_start = len("".join(parts[:j])) + len(word)*(j-1)
+                    if len_start <= i < len_start + len(word):
+                        dict_pos_word[i] = word
+                        break
+            if i in dict_pos_word:
+                break
+    return dict_pos_word
+
+
+def bench_duoyin():
+    """ 多音字匹配: 在样例文章上对比新旧实现的耗时, 并核对结果一致 """
+    dir_dict_yamls = os.path.join(dir_auto_rime, 'dict_yamls')
+    if not os.path.isdir(dir_dict_yamls):
+        print("未找到 dict_yamls 文件夹")
+        return
+    set_chars, _ = load_tables()
+    pattern = compile_charset_pattern(set_chars)
+    lines = list(iter_runs(io.StringIO(read_articles()), pattern))
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        file_base = os.path.join(dir_tmp, 'mapping_table.txt')
+        file_sup = os.path.join(dir_tmp, 'mapping_table_sup.txt')
+        generate_mapping_table_pingyin(dir_dict_yamls, file_base, file_sup)
+        dict_char_words = {}
+        with open(file_sup, 'r', encoding='utf-8') as fr:
+            for line in fr:
+                char, code, words_str = line.strip().split("\t")
+                dict_char_words[char] = sorted(words_str.split(","), key=lambda x: len(x), reverse=False)
+    print(f"多音字 {len(dict_char_words)} 个, 词 {sum(len(w) for w in dict_char_words.values())} 个, 短句 {len(lines)} 个")
+    start = perf_counter()
+    matcher = DuoyinMatcher(dict_char_words)
+    time_build = perf_counter() - start
+    start = perf_counter()
+    res_new = [matcher.match(line) for line in lines]
+    time_new = perf_counter() - start
+    start = perf_counter()
+    res_old = [match_duoyin_legacy(line, dict_char_words) for line in lines]
+    time_old = perf_counter() - start
+    print(f"自动机: 构建 {round(time_build, 3)} 秒, 匹配 {round(time_new, 3)} 秒")
+    print(f"逐词查找: 匹配 {round(time_old, 3)} 秒 (自动机快 {round(time_old / max(time_new, 1e-6), 1)} 倍)")
+    print("结果一致" if res_new == res_old else "WARNING: 结果不一致")
+
+
+def bench_mapping(mode: str=""):
+    """ 拼音映射表生成: 默认模式与低内存模式的耗时和内存峰值 """
+    dir_dict_yamls = os.path.join(dir_auto_rime, 'dict_yamls')
+    if not os.path.isdir(dir_dict_yamls):
+        print("未找到 dict_yamls 文件夹")
+        return
+    if not mode:
+        # 内存峰值按进程统计, 每种模式单独起一个进程
+        for m in ["exact", "low"]:
+            subprocess.run([sys.executable, os.path.abspath(__file__), "mapping", m], check=True)
+        return
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        file_base = os.path.join(dir_tmp, 'mapping_table.txt')
+        file_sup = os.path.join(dir_tmp, 'mapping_table_sup.txt')
+        start = perf_counter()
+        generate_mapping_table_pingyin(dir_dict_yamls, file_base, file_sup, 0, mode == "low")
+        print(f"[{mode}] 耗时 {round(perf_counter() - start, 3)} 秒")
+
+
+
+def bench_perf(size_wan: str="260"):
+    """ 手感指标: 在指定字数的语料编码上对比新旧实现的耗时, 并核对结果一致 """
+    set_chars, dict_char_code = load_tables()
+    pattern = compile_charset_pattern(set_chars)
+    set_chars_user = set(dict_char_code)
+    lines_base = [line for line in iter_runs(io.StringIO(read_articles()), pattern) if set_chars_user.issuperset(line)]
+    size = int(float(size_wan) * 10000)
+    lines, lines_code, cnt_chars = [], [], 0
+    while cnt_chars < size:
+        for line in lines_base:
+            lines.append(line)
+            lines_code.append(encode_line(line, dict_char_code)+"1")
+            cnt_chars += len(line)
+    print(f"语料 {cnt_chars} 字, {len(lines_code)} 行")
+    start = perf_counter()
+    res_old = (sum(get_hu_ji(line) for line in lines_code), sum(get_xzgr(line) for line in lines_code),
+               sum(get_dkp(line) for line in lines_code), sum(get_xkp(line) for line in lines_code))
+    time_old = perf_counter() - start
+    start = perf_counter()
+    engine = PerfEngine()
+    time_build = perf_counter() - start
+    start = perf_counter()
+    res_new = engine.score_lines(lines_code)[0]
+    time_new = perf_counter() - start
+    print(f"逐行计算: {round(time_old, 3)} 秒")
+    print(f"查找表: 构建 {round(time_build, 3)} 秒, 计算 {round(time_new, 3)} 秒 (快 {round(time_old / max(time_new, 1e-6), 1)} 倍)")
+    print("结果一致" if res_new == res_old else "WARNING: 结果不一致")
+    # 字频索引: 建一次, 之后每次只需按码表展开计数
+    start = perf_counter()
+    index = NgramIndex(lines)
+    time_index = perf_counter() - start
+    start = perf_counter()
+    res_index = engine.score(*engine.vectorize(*index.expand(dict_char_code)))[0]
+    time_expand = perf_counter() - start
+    print(f"字频索引: 构建 {round(time_index, 3)} 秒, 展开并计算 {round(time_expand * 1000, 1)} 毫秒")
+    print("结果一致" if res_index == res_old else "WARNING: 结果不一致")
+
+
+def bench_pipeline(*sizes_mb):
+    """ 完整流程: 在合成语料上依次计时 AutoRime 的各阶段, 每种大小在独立进程中运行(内存峰值互不影响) """
+    if len(sizes_mb) == 2 and sizes_mb[0] == "run":
+        run_pipeline(float(sizes_mb[1]))
+        return
+    for size_mb in sizes_mb or ["1", "4", "16"]:
+        subprocess.run([sys.executable, os.path.abspath(__file__), "pipeline", "run", size_mb], check=True)
+
+
+def run_pipeline(size_mb: float):
+    from auto_rime import AutoRime
+    dir_root = os.path.dirname(os.path.abspath(__file__))
+    dir_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        # 临时的程序根目录: 字符集和码表取自本项目, 文章为合成语料, Rime 程序用替身
+        dir_tmp_auto = os.path.join(dir_tmp, 'auto_rime')
+        shutil.copytree(os.path.join(dir_auto_rime, 'charsets'), os.path.join(dir_tmp_auto, 'charsets'))
+        shutil.copy(os.path.join(dir_auto_rime, 'mapping_table.txt'), dir_tmp_auto)
+        os.makedirs(os.path.join(dir_tmp_auto, 'articles'))
+        make_corpus(os.path.join(os.path.join(dir_tmp_auto, 'articles'), 'corpus.txt'), size_mb, read_articles())
+        os.makedirs(os.path.join(dir_tmp, 'Rime'))
+        dir_bin = os.path.join(os.path.join(dir_tmp, 'librime_x86'), 'bin')
+        os.makedirs(dir_bin)
+        for fname in ['rime_deployer', 'rime_api_console']:
+            open(os.path.join(dir_bin, fname), 'w').close()
+        os.chdir(dir_tmp)
+        try:
+            ar = AutoRime(incremental=False, deploy=False)
+            ar.file_exe_console = [sys.executable, os.path.join(dir_root, 'fake_console.py'),
+                                   os.path.join(dir_tmp_auto, 'mapping_table.txt')]
+            fnames = ['corpus.txt']
+            list_cost = []
+            start = perf_counter()
+            for fname in fnames:
+                ar.process_article(fname)
+            list_cost.append(("预处理", perf_counter() - start))
+            start = perf_counter()
+            for fname in fnames:
+                ar.generate_stdin_file(fname)
+            list_cost.append(("生成编码", perf_counter() - start))
+            start = perf_counter()
+            ar.simulate_all(fnames)
+            list_cost.append(("模拟", perf_counter() - start))
+            start = perf_counter()
+            stats = [ar.get_statistics(fname) for fname in fnames]
+            list_cost.append(("统计", perf_counter() - start))
+        finally:
+            os.chdir(dir_cwd)
+    cnt_lines = sum(t[0] for t in stats)
+    time_total = sum(t for _, t in list_cost)
+    rss_self, rss_children = get_peak_rss()
+    print(f"===== {size_mb:g} MB: {cnt_lines} 句, {sum(t[4] for t in stats)} 字 =====")
+    for name, t in list_cost:
+        print(f"  {name}: {round(t, 3)} 秒, {round(cnt_lines / max(t, 1e-6), 1)} 句/秒")
+    print(f"  合计: {round(time_total, 3)} 秒, {round(cnt_lines / max(time_total, 1e-6), 1)} 句/秒")
+    print(f"  内存峰值: 本进程 {rss_self} MB, 子进程 {rss_children} MB")
+
+
+if __name__ == '__main__':
+    benches = {"segment": bench_segment, "duoyin": bench_duoyin, "mapping": bench_mapping, "perf": bench_perf,
+               "pipeline": bench_pipeline}
+    name = sys.argv[1] if len(sys.argv) > 1 else "segment"
+    if name not in benches:
+        print("可用的测试项：", ", ".join(benches))
+    else:
+        benches[name](*sys.argv[2:])
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import pickle
+import sqlite3
+import hashlib
+from collections import deque
+from time import perf_counter
+
+CACHE_VERSION = "1"  # 缓存内容的格式或生成逻辑变化时递增, 使旧缓存失效
+
+
+def hash_files(*files: str, extra: str="") -> str:
+    """ 按文件名和内容计算摘要, extra 用于附加影响结果的选项 """
+    h = hashlib.sha1(f"{CACHE_VERSION}|{extra}".encode('utf-8'))
+    for file in files:
+        h.update(os.path.basename(file).encode('utf-8') + b"\0")
+        with open(file, 'rb') as fr:
+            while True:
+                chunk = fr.read(1 << 20)
+                if not chunk:
+                    break
+                h.update(chunk)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def load_cache(dir_cache: str, kind: str, key: str):
+    """ 读取缓存, 不存在或已损坏时返回 None """
+    file_cache = os.path.join(dir_cache, f"{kind}-{key}.pickle")
+    if not os.path.exists(file_cache):
+        return None
+    try:
+        with open(file_cache, 'rb') as fr:
+            return pickle.load(fr)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def save_cache(dir_cache: str, kind: str, key: str, obj):
+    """ 写入缓存(同类的旧缓存一并删除; 类别名本身可含 "-", 只删除其后恰为一个摘要的) """
+    if not os.path.exists(dir_cache):
+        os.makedirs(dir_cache)
+    for fname in os.listdir(dir_cache):
+        if fname.startswith(kind+"-") and fname.endswith(".pickle") and "-" not in fname[len(kind)+1:]:
+            os.remove(os.path.join(dir_cache, fname))
+    file_cache = os.path.join(dir_cache, f"{kind}-{key}.pickle")
+    with open(file_cache+".tmp", 'wb') as fw:
+        pickle.dump(obj, fw, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(file_cache+".tmp", file_cache)
+
+
+def hash_dir(dir_root: str) -> str:
+    """ 按相对路径和内容计算整个文件夹的摘要 """
+    files = []
+    if os.path.isdir(dir_root):
+        for dir_cur, dirs, fnames in os.walk(dir_root):
+            dirs.sort()
+            files += [os.path.join(dir_cur, fname) for fname in sorted(fnames)]
+    h = hashlib.sha1(CACHE_VERSION.encode('utf-8'))
+    for file in files:
+        h.update(os.path.relpath(file, dir_root).encode('utf-8') + b"\0")
+        h.update(hash_files(file).encode('utf-8'))
+    return h.hexdigest()
+
+
+class ResultStore:
+    """ 模拟结果的持久化存储: (短句, 编码, Rime 部署摘要) -> 上屏结果 """
+    def __init__(self, file_db: str, build_hash: str):
+        self.file_db = file_db
+        self.build_hash = build_hash
+        self.cnt_hit = 0
+        self.cnt_miss = 0
+        self.conn = sqlite3.connect(file_db)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS results (build TEXT, sentence TEXT, code TEXT, commit_text TEXT, "
+                          "PRIMARY KEY (build, sentence, code))")
+        # 本次部署的结果一次性读入内存, 查询时不必跨线程访问数据库
+        self.dict_result = {(sentence, code): commit_text for sentence, code, commit_text in self.conn.execute(
+            "SELECT sentence, code, commit_text FROM results WHERE build = ?", (build_hash,))}
+
+    def run(self, engine, pairs):
+        """ 已有结果的句子直接复用, 其余交给 engine 模拟; 按输入顺序产出上屏结果
+        新的结果在全部产出后才写入结果库 """
+        deque_slot = deque()  # (短句, 编码, 是否命中, 已有结果)
+        list_new = []
+        miss = object()
+
+        def iter_misses():
+            for sentence, code in pairs:
+                commit_text = self.dict_result.get((sentence, code), miss)
+                if commit_text is miss:
+                    deque_slot.append((sentence, code, False, None))
+                    yield code
+                else:
+                    deque_slot.append((sentence, code, True, commit_text))
+
+        for line_out in engine.run(iter_misses()):
+            while deque_slot[0][2]:
+                self.cnt_hit += 1
+                yield deque_slot.popleft()[3]
+            sentence, code, _, _ = deque_slot.popleft()
+            self.cnt_miss += 1
+            if line_out is None or "\ufffd" not in line_out:
+                list_new.append((self.build_hash, sentence, code, line_out))
+            yield line_out
+        while deque_slot:
+            self.cnt_hit += 1
+            yield deque_slot.popleft()[3]
+        # 只在引擎正常结束(已核对各进程的输出行数)后保存: 中途出错或提前关闭时, 已得到的结果可能与句子错位
+        self.conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", list_new)
+        self.conn.commit()
+
+    def report(self):
+        cnt = self.cnt_hit + self.cnt_miss
+        if cnt:
+            print(f"  复用以往结果: {self.cnt_hit}/{cnt} 行 (命中率 {round(self.cnt_hit / cnt * 100, 2)}%), 实际模拟 {self.cnt_miss} 行")
+
+    def close(self):
+        self.conn.close()
+
+
+class Dedup:
+    """ 同一次模拟中重复出现的 (短句, 编码) 只模拟一次, 结果按出现次数原样展开, 与逐句模拟的结果相同 """
+    def __init__(self):
+        self.cnt_all = 0
+        self.cnt_unique = 0
+        self.time_run = 0.0
+
+    def run(self, run_pairs, pairs):
+        """ run_pairs 为实际模拟的函数(传入 (短句, 编码) 的迭代器, 按顺序产出上屏结果), 按输入顺序产出全部结果
+        结果按顺序产出, 重复的句子排到时其首次出现的结果必已得到 """
+        dict_result = {}  # (短句, 编码): 上屏结果
+        deque_slot = deque()  # ((短句, 编码), 是否首次出现)
+
+        def iter_unique():
+            for pair in pairs:
+                self.cnt_all += 1
+                if pair in dict_result:
+                    deque_slot.append((pair, False))
+                else:
+                    dict_result[pair] = None
+                    self.cnt_unique += 1
+                    deque_slot.append((pair, True))
+                    yield pair
+
+        start = perf_counter()
+        try:
+            for line_out in run_pairs(iter_unique()):
+                while not deque_slot[0][1]:
+                    yield dict_result[deque_slot.popleft()[0]]
+                dict_result[deque_slot.popleft()[0]] = line_out
+                yield line_out
+            while deque_slot:
+                yield dict_result[deque_slot.popleft()[0]]
+        finally:
+            self.time_run += perf_counter() - start
+
+    def report(self):
+        cnt_dup = self.cnt_all - self.cnt_unique
+        if cnt_dup:
+            # 按本次模拟的平均速度估算省下的时间
+            time_saved = self.time_run / max(self.cnt_unique, 1) * cnt_dup
+            print(f"  重复句去重: {self.cnt_all} 行中有 {self.cnt_unique} 个不同的句子 (去重率 {round(cnt_dup / self.cnt_all * 100, 2)}%), "
+                  f"少模拟 {cnt_dup} 行, 约节省 {round(time_saved, 2)} 秒")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import hashlib
+
+SIZE_SHARD = 4 << 20  # 分片的目标大小(字节)
+
+
+def iter_shard_ranges(file_in: str, size_shard: int=SIZE_SHARD, pattern: re.Pattern=None):
+    """ 按字节大小把文件切成分片, 切分点取在换行符之后(短句不会跨分片), 产出 (分片号, 起点, 终点)
+    只在切分点附近读取少量字节, 续跑时不必从头读文件; 整段不换行时切在 pattern 匹配的短句之后 """
+    size = os.path.getsize(file_in)
+    with open(file_in, 'rb') as fr:
+        idx, start = 0, 0
+        while start < size:
+            end = min(start + size_shard, size)
+            if end < size:
+                fr.seek(end)
+                buf = fr.read(1 << 16)
+                pos = buf.find(b"\n")
+                if pos > -1:
+                    end += pos + 1
+                else:
+                    # 超长的行: 不切断 UTF-8 字符, 也不切断短句
+                    i = 0
+                    while i < len(buf) and 0x80 <= buf[i] < 0xC0:
+                        i += 1
+                    if pattern:
+                        text = buf[i:].decode('utf-8', errors='ignore')
+                        m = pattern.match(text)
+                        if m:
+                            i += len(m.group().encode('utf-8'))
+                    end += i
+            yield idx, start, end
+            idx, start = idx + 1, end
+
+
+def read_shard(file_in: str, start: int, end: int) -> str:
+    with open(file_in, 'rb') as fr:
+        fr.seek(start)
+        return fr.read(end - start).decode('utf-8')
+
+
+class ShardManifest:
+    """ 分片模式的进度记录: 已完成的分片及其统计结果, 每完成一片即写盘, 中断后据此续跑
+    key 为输入文件和模拟条件的摘要, 不一致时从头开始 """
+    def __init__(self, file_manifest: str, key: str):
+        self.file_manifest = file_manifest
+        self.key = key
+        self.dict_done = {}  # 分片号: {"start", "end", "stats"}
+        if os.path.exists(file_manifest):
+            try:
+                with open(file_manifest, 'r', encoding='utf-8') as fr:
+                    data = json.load(fr)
+                if data.get("key") == key:
+                    self.dict_done = {int(k): v for k, v in data["shards"].items()}
+            except (OSError, ValueError, KeyError):
+                pass
+
+    def is_done(self, idx: int) -> bool:
+        return idx in self.dict_done
+
+    def complete(self, idx: int, start: int, end: int, stats: list):
+        self.dict_done[idx] = {"start": start, "end": end, "stats": stats}
+        with open(self.file_manifest+".tmp", 'w', encoding='utf-8') as fw:
+            json.dump({"key": self.key, "shards": self.dict_done}, fw)
+        os.replace(self.file_manifest+".tmp", self.file_manifest)
+
+    def stats_total(self) -> list:
+        stats = [0, 0, 0, 0, 0, 0]
+        for shard in self.dict_done.values():
+            for i in range(6):
+                stats[i] += shard["stats"][i]
+        return stats
+
+
+def input_key(file_in: str, *options) -> str:
+    """ 进度记录的校验值: 文件大小和修改时间(不读全文), 以及影响结果的选项 """
+    stat = os.stat(file_in)
+    text = "|".join(str(x) for x in [stat.st_size, stat.st_mtime_ns, *options])
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class Checkpoint:
+    """ 逐篇模拟的断点记录: 每篇文章模拟完即写入输入、编码和上屏结果, 统计完再写入统计结果和未匹配的行
+    续跑(--resume)时已有统计结果且 key 一致的文章不再重新模拟 """
+    def __init__(self, dir_checkpoint: str):
+        self.dir_checkpoint = dir_checkpoint
+        if not os.path.exists(dir_checkpoint):
+            os.makedirs(dir_checkpoint)
+
+    def file(self, fname: str) -> str:
+        return os.path.join(self.dir_checkpoint, os.path.splitext(fname)[0]+".json")
+
+    def load(self, fname: str, key: str):
+        """ 读取断点, 不存在、已损坏或 key 不一致时返回 None """
+        try:
+            with open(self.file(fname), 'r', encoding='utf-8') as fr:
+                data = json.load(fr)
+        except (OSError, ValueError):
+            return None
+        return data if data.get("key") == key else None
+
+    def save(self, fname: str, key: str, data: dict):
+        file_checkpoint = self.file(fname)
+        with open(file_checkpoint+".tmp", 'w', encoding='utf-8') as fw:
+            json.dump(dict(data, key=key), fw, ensure_ascii=False)
+        os.replace(file_checkpoint+".tmp", file_checkpoint)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# 模拟 rime_api_console 的替身(基准测试用, 不依赖 librime): 用法 python fake_console.py [mapping_table.txt] [--drop N] [--garble N]
+# 逐行读入编码(末尾的 1 表示选首选), 按映射表反查成字后以 "commit: " 输出, 读到 exit 时退出
+# 与 rime_api_console 一样回显 "set option 选项名" 命令; --drop/--garble 使第 N 个编码不上屏/上屏乱码(测试用)
+# 同码的字取映射表中最先出现的, 编码按能拆分成的最长码优先切分, 输出只由输入决定
+
+import os
+import sys
+import argparse
+
+
+def load_table(file_mapping: str) -> dict:
+    """ 编码: 字(同码取最先出现的) """
+    dict_code_char = {}
+    with open(file_mapping, 'r', encoding='utf-8') as fr:
+        for line in fr:
+            line = line.strip()
+            if line:
+                char, code = line.split('\t')
+                dict_code_char.setdefault(code, char)
+    return dict_code_char
+
+
+def decode(code: str, dict_code_char: dict, len_max: int) -> str:
+    """ 从后往前求各位置起能完整切分的结果, 每处取最长的码 """
+    best = {len(code): ""}
+    for i in range(len(code)-1, -1, -1):
+        for j in range(min(len(code), i+len_max), i, -1):
+            if j in best and code[i:j] in dict_code_char:
+                best[i] = dict_code_char[code[i:j]] + best[j]
+                break
+    return best.get(0, "")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file_mapping', nargs='?', default=os.path.join(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'auto_rime'), 'mapping_table.txt'))
+    parser.add_argument('--drop', type=int, default=0)
+    parser.add_argument('--garble', type=int, default=0)
+    args = parser.parse_args()
+    dict_code_char = load_table(args.file_mapping)
+    len_max = max(map(len, dict_code_char), default=1)
+    fw = sys.stdout.buffer
+    cnt = 0
+    for raw in sys.stdin.buffer:
+        code = raw.decode('utf-8').strip()
+        if code == "exit":
+            break
+        if not code:
+            continue
+        if code.startswith("set option "):
+            option = code[len("set option "):]
+            fw.write(f"{option.lstrip('!')} set {'off' if option.startswith('!') else 'on'}.\n".encode('utf-8'))
+            continue
+        cnt += 1
+        if cnt == args.drop:
+            continue
+        if cnt == args.garble:
+            fw.write(b"commit: \xff\n")
+            continue
+        fw.write(b"commit: " + decode(code.rstrip("1"), dict_code_char, len_max).encode('utf-8') + b"\n")
+    fw.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,9 @@
 
 import os
 import re
+import sys
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 def get_charset(*files: str) -> set[str]:
     str_charset = ""
@@ -17,50 +19,248 @@ def get_charset(*files: str) -> set[str]:
             # str_charset += fr.read().replace("\r", "").replace("\n", "")
     return set(str_charset)
 
-def generate_mapping_table_pingyin(dir_dict_yamls, file_base, file_sup, len_code: int=0):
+def compile_charset_pattern(chars) -> re.Pattern:
+    """ 将字符集编译为匹配连续汉字(短句)的正则, 相邻码位合并为区间以缩短字符类 """
+    points = sorted(ord(c) for c in chars)
+    ranges = []
+    i = 0
+    while i < len(points):
+        j = i
+        while j+1 < len(points) and points[j+1] == points[j] + 1:
+            j += 1
+        if j > i:
+            ranges.append(f"{re.escape(chr(points[i]))}-{re.escape(chr(points[j]))}")
+        else:
+            ranges.append(re.escape(chr(points[i])))
+        i = j + 1
+    return re.compile(f"[{''.join(ranges)}]+")
+
+def iter_runs(fr, pattern: re.Pattern, size_chunk: int=1<<20):
+    """ 分块读取文本, 逐个产出匹配 pattern 的连续片段(片段可以跨块) """
+    rest = ""
+    while True:
+        chunk = fr.read(size_chunk)
+        if not chunk:
+            break
+        text = rest + chunk
+        rest = ""
+        for m in pattern.finditer(text):
+            if m.end() == len(text):
+                # 可能在下一块中继续, 暂存
+                rest = m.group()
+            else:
+                yield m.group()
+    if rest:
+        yield rest
+
+def encode_line(line: str, dict_char_code: dict) -> str:
+    """ 按单字码表生成短句编码 """
+    try:
+        return "".join([dict_char_code[char] for char in line])
+    except KeyError as e:
+        raise UnicodeError("该字符的编码不存在："+e.args[0])
+
+class AhoCorasick:
+    """ Aho–Corasick 多模式匹配自动机 """
+    def __init__(self, words):
+        self.goto = [{}]  # 状态转移
+        self.fail = [0]  # 失配跳转
+        self.out = [()]  # 到达该状态时匹配到的词(含失配链上的)
+        for word in words:
+            if not word:
+                continue
+            state = 0
+            for char in word:
+                nxt = self.goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][char] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                state = nxt
+            self.out[state] = (word,)
+        # 按层(BFS)计算失配跳转
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, nxt in self.goto[state].items():
+                f = self.fail[state]
+                while f and char not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(char, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+                queue.append(nxt)
+
+    def iter_matches(self, text: str):
+        """ 扫描一遍, 按结束位置顺序产出 (起始位置, 词) """
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for word in out[state]:
+                yield i - len(word) + 1, word
+
+
+class DuoyinMatcher:
+    """ 多音字匹配: 一次扫描短句, 找出位于(特别读音的)词中的多音字 """
+    def __init__(self, dict_char_words: dict):
+        # 每个多音字的候选词及其优先级(列表中越靠前越优先)
+        self.dict_char_rank = {}
+        for char, words in dict_char_words.items():
+            dict_rank = {}
+            for k, word in enumerate(words):
+                dict_rank.setdefault(word, k)
+            self.dict_char_rank[char] = dict_rank
+        self.automaton = AhoCorasick({word for words in dict_char_words.values() for word in words})
+
+    def match(self, line: str) -> dict:
+        """ 返回 {多音字位置: 匹配到的词} """
+        dict_word_end = {}  # 同一个词只取互不重叠的出现(同 str.split)
+        dict_pos_rank = {}
+        dict_pos_word = {}
+        for start, word in self.automaton.iter_matches(line):
+            if start < dict_word_end.get(word, 0):
+                continue
+            dict_word_end[word] = start + len(word)
+            for pos in range(start, start + len(word)):
+                dict_rank = self.dict_char_rank.get(line[pos])
+                if dict_rank and word in dict_rank:
+                    rank = dict_rank[word]
+                    if pos not in dict_pos_rank or rank < dict_pos_rank[pos]:
+                        dict_pos_rank[pos] = rank
+                        dict_pos_word[pos] = word
+        return dict_pos_word
+
+
+def get_peak_rss() -> tuple[float, float]:
+    """ 返回(本进程, 子进程中最大的)内存峰值, 单位 MB """
+    try:
+        import resource
+        unit = 1024*1024 if sys.platform == 'darwin' else 1024  # macOS 下单位为字节
+        rss_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+        rss_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit
+        return round(rss_self, 1), round(rss_children, 1)
+    except ImportError:
+        # Windows: 只能取到本进程的峰值
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                 ctypes.byref(counters), counters.cb)
+        return round(counters.PeakWorkingSetSize / (1024*1024), 1), 0.0
+
+def iter_dict_yaml(file_yaml, len_code: int=0):
+    """ 逐条产出 dict.yaml 中的单字 (字, 码) 和词 (词, 各字的码) """
+    with open(file_yaml, 'r', encoding='utf-8') as fr:
+        for line in fr:
+            line = line.strip()
+            if line.startswith("#") or ("\t" not in line):
+                continue
+            word, codes, *trash = line.split('\t')
+            # 处理字
+            n = len(word)
+            if n == 1:
+                yield word, codes[:len_code] if len_code else codes
+                continue
+            # 处理词
+            if " " not in codes or "," in word:
+                continue
+            lst_code = codes.split(" ")
+            if len(lst_code) == n:
+                yield word, [code[:len_code] for code in lst_code] if len_code else lst_code
+
+def _read_dict_yaml_exact(file_yaml, len_code):
+    """ 读取一个 dict.yaml, 保留(字,词,码)以便同一个词只计一次 """
+    dict_char_codes = defaultdict(set)
+    d_d_str = defaultdict(dict) # 字,词,码
+    d_d_int = defaultdict(dict) # 字,码,数
+    for word, code in iter_dict_yaml(file_yaml, len_code):
+        if len(word) == 1:
+            dict_char_codes[word].add(code)
+            continue
+        for i in range(len(word)):
+            d_d_str[word[i]][word] = code[i]
+            d_d_int[word[i]][code[i]] = 0 # 填充,为后面做准备
+    return dict_char_codes, d_d_str, d_d_int
+
+def _count_dict_yaml(file_yaml, len_code):
+    """ 读取一个 dict.yaml, 只统计每个(字,码)下的词条数, 不保留词 """
+    dict_char_codes = defaultdict(set)
+    d_d_int = defaultdict(dict) # 字,码,数
+    for word, code in iter_dict_yaml(file_yaml, len_code):
+        if len(word) == 1:
+            dict_char_codes[word].add(code)
+            continue
+        # 同一个词中重复出现的字只计一次(取最后一个码)
+        for char, c in dict(zip(word, code)).items():
+            d_int = d_d_int[char]
+            d_int[c] = d_int.get(c, 0) + 1
+    return dict_char_codes, d_d_int
+
+def _collect_dict_yaml_sup(file_yaml, len_code, dct_char_code):
+    """ 读取一个 dict.yaml, 只收集不是常用读音的词 """
+    dct_pair_words = defaultdict(dict) # 字\t码: 词(用 dict 去重并保序)
+    for word, code in iter_dict_yaml(file_yaml, len_code):
+        if len(word) == 1:
+            continue
+        for char, c in dict(zip(word, code)).items():
+            if c != dct_char_code[char]:
+                dct_pair_words[char+"\t"+c][word] = None
+    return dct_pair_words
+
+def _map_files(func, files, num_workers, *args):
+    """ 多个文件分别交给子进程处理, 结果按文件顺序返回 """
+    if num_workers == 1 or len(files) <= 1:
+        return [func(file, *args) for file in files]
+    with ProcessPoolExecutor(max_workers=min(num_workers or os.cpu_count() or 1, len(files))) as executor:
+        return list(executor.map(func, files, *[[arg]*len(files) for arg in args]))
+
+def generate_mapping_table_pingyin(dir_dict_yamls, file_base, file_sup, len_code: int=0, low_memory: bool=False, num_workers: int=0):
+    """ 生成拼音方案的映射表, 各 dict.yaml 并行读取
+
+    low_memory 为 True 时只统计每个(字,码)下的词条数, 第二遍读取时再收集非常用读音的词,
+    内存占用与词库大小基本无关; 但重复出现的词条会重复计数(默认模式下同一个词只计一次).
+    """
     if len_code < 0 or len_code == 1:
         raise BaseException("输入的单字编码长度不支持")
-    print("正在生成单字映射表...", end="")
+    print("正在生成单字映射表...", end="", flush=True)
+    files = [os.path.join(dir_dict_yamls, fname) for fname in os.listdir(dir_dict_yamls) if fname.endswith(".dict.yaml")]
     # 1.读取全部数据, 分别识别单字和词
     dict_char_codes = defaultdict(set)
     d_d_str = defaultdict(dict) # 字,词,码
     d_d_int = defaultdict(dict) # 字,码,数
-    for fname in os.listdir(dir_dict_yamls):
-        if fname.endswith(".dict.yaml"):
-            file_yaml = os.path.join(dir_dict_yamls, fname)
-            with open(file_yaml, 'r', encoding='utf-8') as fr:
-                for line in fr:
-                    line = line.strip()
-                    if line.startswith("#") or ("\t" not in line):
-                        continue
-                    word, codes, *trash = line.split('\t')
-                    # 处理字
-                    n = len(word)
-                    if n == 1:
-                        if len_code:
-                            dict_char_codes[word].add(codes[:len_code])
-                        else:
-                            dict_char_codes[word].add(codes)
-                        continue
-                    # 处理词
-                    if " " not in codes or "," in word:
-                        continue
-                    lst_code = codes.split(" ")
-                    if len(lst_code) == n:
-                        for i in range(n):
-                            if len_code:
-                                d_d_str[word[i]][word] = lst_code[i][:len_code]
-                                d_d_int[word[i]][lst_code[i][:len_code]] = 0 # 填充,为后面做准备
-                            else:
-                                d_d_str[word[i]][word] = lst_code[i]
-                                d_d_int[word[i]][lst_code[i]] = 0 # 填充,为后面做准备
+    if not low_memory:
+        for dct_codes, dd_str, dd_int in _map_files(_read_dict_yaml_exact, files, num_workers, len_code):
+            for char, codes in dct_codes.items():
+                dict_char_codes[char].update(codes)
+            for char, d_str in dd_str.items():
+                d_d_str[char].update(d_str)
+            for char, d_int in dd_int.items():
+                for code in d_int:
+                    d_d_int[char].setdefault(code, 0)
+        # 计数：每个音下词的数量
+        for char, d_str in d_d_str.items():
+            for word, code in d_str.items():
+                d_d_int[char][code] += 1
+    else:
+        for dct_codes, dd_int in _map_files(_count_dict_yaml, files, num_workers, len_code):
+            for char, codes in dct_codes.items():
+                dict_char_codes[char].update(codes)
+            for char, d_int in dd_int.items():
+                for code, num in d_int.items():
+                    d_d_int[char][code] = d_d_int[char].get(code, 0) + num
     # 2.(词范围内)找出使用最多的那个读音
     dct_char_code = {}
-    # 计数：每个音下词的数量
-    for char, d_str in d_d_str.items():
-        for word, code in d_str.items():
-            d_d_int[char][code] += 1
-    # 提取：找出词最多的读音
     for char, d_int in d_d_int.items():
         m = max(d_int.values())
         for code, num in d_int.items():
@@ -79,77 +279,28 @@ def generate_mapping_table_pingyin(dir_dict_yamls, file_base, file_sup, len_code
                 code = list(codes)[0] # 只取一个码
                 fw.write(f"{char}\t{code}\n")
     # 3.(词范围内)剔除(每个字)使用最多的那个读音(及相应组合)
-    dct_pair_words = defaultdict(list)
-    # 过滤&合并
-    for char, d_str in d_d_str.items():
-        for word, code in d_str.items():
-            if code != dct_char_code[char]:
-                pair = char+"\t"+code
-                dct_pair_words[pair].append(word)
+    dct_pair_words = defaultdict(dict)
+    if not low_memory:
+        # 过滤&合并
+        for char, d_str in d_d_str.items():
+            for word, code in d_str.items():
+                if code != dct_char_code[char]:
+                    pair = char+"\t"+code
+                    dct_pair_words[pair][word] = None
+    else:
+        # 第二遍读取
+        for dct_pairs in _map_files(_collect_dict_yaml_sup, files, num_workers, len_code, dct_char_code):
+            for pair, words in dct_pairs.items():
+                dct_pair_words[pair].update(words)
+        # 与默认模式一致: 按字首次出现的顺序排列
+        dict_char_rank = {char: k for k, char in enumerate(dct_char_code)}
+        dct_pair_words = dict(sorted(dct_pair_words.items(), key=lambda x: dict_char_rank[x[0].split("\t")[0]]))
     # 保存 mapping_sup 表
     with open(file_sup, 'w', encoding='utf-8') as fw:
         for pair, words in dct_pair_words.items():
             fw.write(f"{pair}\t{",".join(words)}\n")
-    print("映射表生成完毕.")
-
-def qiefen_trap():
-    file_dzmb = "mapping_table.txt"
-    dict_len2code_chars = defaultdict(list)
-    dict_len3code_chars = defaultdict(list)
-    with open(file_dzmb, 'r', encoding='utf-8') as fr:
-        for line in fr:
-            char, code = line.strip().split("\t")
-            if len(code) == 2:
-                dict_len2code_chars[code].append(char)
-            elif len(code) == 3:
-                dict_len3code_chars[code].append(char)
-            else:
-                print("ERROR: code length not 2 or 3")
-    # print(len(dict_char_len2code)+len(dict_char_len3code))
-    with open('qiefen_23and32.txt', 'w', encoding='utf-8') as fw:
-        for code2,chars2 in dict_len2code_chars.items():
-            for code3,chars3 in dict_len3code_chars.items():
-                left = code2+code3[:1]
-                right = code3[1:]
-                if left in dict_len3code_chars and right in dict_len2code_chars:
-                    chars_left = dict_len3code_chars[left]
-                    chars_right = dict_len2code_chars[right]
-                    fw.write(f"{code2}{code3}\t")
-                    # 23
-                    for cl in chars2:
-                        for cr in chars3:
-                            fw.write(f",{cl}{cr}")
-                    fw.write("\t")
-                    # 32
-                    for cl in chars_left:
-                        for cr in chars_right:
-                            fw.write(f",{cl}{cr}")
-                    fw.write("\n")
-    with open('qiefen_222and33.txt', 'w', encoding='utf-8') as fw:
-        set_len6 = set()
-        for code3a,chars3a in dict_len3code_chars.items():
-            for code3b,chars3b in dict_len3code_chars.items():
-                str_len6 = code3a+code3b
-                if str_len6 not in set_len6:
-                    set_len6.add(code3a+code3b)
-                    lef = str_len6[:2]
-                    mid = str_len6[2:4]
-                    rig = str_len6[4:]
-                    if lef in dict_len2code_chars and mid in dict_len2code_chars and rig in dict_len2code_chars:
-                        fw.write(f"{code3a}{code3b}\t")
-                        # 33
-                        for cl in chars3a:
-                            for cr in chars3b:
-                                fw.write(f",{cl}{cr}")
-                        fw.write("\t")
-                        # 222
-                        for cl in dict_len2code_chars[lef]:
-                            for cm in dict_len2code_chars[mid]:
-                                for cr in dict_len2code_chars[rig]:
-                                    fw.write(f",{cl}{cm}{cr}")
-                        fw.write("\n")
-
-
+    rss_self, rss_children = get_peak_rss()
+    print(f"映射表生成完毕. (内存峰值: 主进程 {rss_self} MB, 子进程 {rss_children} MB)")
 
 tz = {'qaz', 'wsx', 'edc', 'rfvtgb', 'yhnujm', 'ik', 'ol', 'p'}
 xiao_kp = {'qa', 'ws', 'ed', 'rf', 'tg', 'rg', 'tf', 'yh', 'uj', 
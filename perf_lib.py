@@ -0,0 +1,405 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+from collections import Counter, namedtuple
+
+try:
+    import numpy as np
+except ImportError:  # 没有 numpy 时用纯 Python 计数, 结果相同
+    np = None
+
+# 内置的 QWERTY 布局(与旧版 left_key/right_key/xiao_kp/da_kp/gr 的统计口径一致, 未列出的键不参与统计)
+# 每行一键: 键 手 指 排 列
+#   手: L 左手, R 右手, * 两手皆可(如空格, 与任何键相邻都算互击)
+#   指: 0 拇指, 1 食指, 2 中指, 3 无名指, 4 小指, - 不计同指类指标
+#   排: 0 上排, 1 中排, 2 下排, 3 空格排
+LAYOUT_QWERTY = """
+name: QWERTY
+q L 4 0 0
+w L 3 0 1
+e L 2 0 2
+r L 1 0 3
+t L 1 0 4
+a L 4 1 0
+s L 3 1 1
+d L 2 1 2
+f L 1 1 3
+g L 1 1 4
+z L 4 2 0
+x L 3 2 1
+c L 2 2 2
+v L 1 2 3
+b L 1 2 4
+y R 1 0 5
+u R 1 0 6
+i R 2 0 7
+o R 3 0 8
+p R 4 0 9
+h R 1 1 5
+j R 1 1 6
+k R 2 1 7
+l R 3 1 8
+; R - 1 9
+n R 1 2 5
+m R 1 2 6
+_ * 0 3 0
+"""
+
+# 内置指标(即 get_statistics_perf 的四项): 指标名 = 条件, 条件, ...(全部满足时计数一次)
+#   二元指标的条件作用于相邻两键:
+#     diff_hand 左右互击, same_hand 同手, same_finger 同手同指, diff_key 不同键,
+#     row_gap=N / row_gap<=N / row_gap>=N 排差, col_gap=N / col_gap<=N / col_gap>=N 列差,
+#     fingers=A/B 两键分别为 A 指和 B 指(不分先后)
+#   三元指标: 上述条件加前缀 12: / 23: / 13: 指定作用的两键, 另有 redirect 同手三键的列方向改变
+METRICS_DEFAULT = """
+互击 = diff_hand
+小指干扰 = same_hand, fingers=4/3
+大跨排 = same_finger, row_gap=2
+小跨排 = same_finger, diff_key, row_gap<=1
+"""
+
+KeyPos = namedtuple('KeyPos', ['key', 'hand', 'finger', 'row', 'col'])
+
+
+class Layout:
+    """ 键盘布局: 键 -> (手, 指, 排, 列) """
+    def __init__(self, name: str, dict_key_pos: dict):
+        self.name = name
+        self.dict_key_pos = dict_key_pos
+
+    @classmethod
+    def parse(cls, text: str, name: str=""):
+        dict_key_pos = {}
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("name:"):
+                name = line[5:].strip()
+                continue
+            parts = line.split()
+            if len(parts) != 5 or len(parts[0]) != 1 or ord(parts[0]) > 127 or parts[1] not in ["L", "R", "*"]:
+                raise BaseException(f"布局 {name} 中的键位定义有误: {line}")
+            key, hand, finger, row, col = parts
+            dict_key_pos[key] = KeyPos(key, hand, None if finger == "-" else int(finger), int(row), int(col))
+        return cls(name, dict_key_pos)
+
+    @classmethod
+    def from_file(cls, file_layout: str):
+        with open(file_layout, 'r', encoding='utf-8') as fr:
+            return cls.parse(fr.read(), os.path.splitext(os.path.basename(file_layout))[0])
+
+
+def load_layouts(dir_layouts: str) -> list[Layout]:
+    """ 内置 QWERTY 布局在前, 其后为文件夹中的 .txt 布局文件 """
+    layouts = [Layout.parse(LAYOUT_QWERTY)]
+    if os.path.isdir(dir_layouts):
+        for fname in sorted(os.listdir(dir_layouts)):
+            if fname.endswith(".txt"):
+                layouts.append(Layout.from_file(os.path.join(dir_layouts, fname)))
+    return layouts
+
+
+def _same_hand(x, y) -> bool:
+    return x.hand == y.hand and x.hand in "LR"
+
+
+def _gap(attr, op, n):
+    def cond(x, y):
+        gap = abs(getattr(x, attr) - getattr(y, attr))
+        return gap == n if op == "=" else (gap <= n if op == "<=" else gap >= n)
+    return cond
+
+
+def _parse_cond(word: str):
+    """ 条件名 -> 作用于两个键位的判断函数(键位未定义的键记为 None, 一律不满足, 互击除外) """
+    if word == "diff_hand":
+        return lambda x, y: (x is not None and x.hand == "*") or (y is not None and y.hand == "*") \
+            or (x is not None and y is not None and {x.hand, y.hand} == {"L", "R"})
+    if word == "same_hand":
+        cond = _same_hand
+    elif word == "same_finger":
+        cond = lambda x, y: _same_hand(x, y) and x.finger is not None and x.finger == y.finger
+    elif word == "diff_key":
+        cond = lambda x, y: x.key != y.key
+    elif word.startswith("fingers="):
+        fingers = sorted(int(f) for f in word[8:].split("/"))
+        cond = lambda x, y: x.finger is not None and y.finger is not None and sorted([x.finger, y.finger]) == fingers
+    else:
+        cond = None
+        for attr in ["row", "col"]:
+            for op in ["<=", ">=", "="]:
+                prefix = f"{attr}_gap{op}"
+                if cond is None and word.startswith(prefix):
+                    cond = _gap(attr, op, int(word[len(prefix):]))
+        if cond is None:
+            raise BaseException(f"无法识别的指标条件: {word}")
+    return lambda x, y: x is not None and y is not None and cond(x, y)
+
+
+def _redirect(x, y, z) -> bool:
+    return x is not None and y is not None and z is not None and _same_hand(x, y) and _same_hand(y, z) \
+        and (y.col - x.col) * (z.col - y.col) < 0
+
+
+class Metric:
+    """ 手感指标: 二元(相邻两键)或三元(相邻三键)的计数规则 """
+    def __init__(self, name: str, rule: str):
+        self.name = name
+        self.conds = []  # (作用的键序号, 判断函数)
+        self.n = 2
+        for word in [w.strip() for w in rule.split(",") if w.strip()]:
+            if word == "redirect":
+                self.n = 3
+                self.conds.append(((0, 1, 2), _redirect))
+            elif word[:3] in ["12:", "23:", "13:"]:
+                self.n = 3
+                self.conds.append(((int(word[0])-1, int(word[1])-1), _parse_cond(word[3:])))
+            else:
+                self.conds.append(((0, 1), _parse_cond(word)))
+
+    def eval(self, poses) -> int:
+        return int(all(cond(*[poses[i] for i in idx]) for idx, cond in self.conds))
+
+
+def parse_metrics(text: str) -> list[Metric]:
+    metrics = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            if "=" not in line:
+                raise BaseException(f"指标定义有误: {line}")
+            name, rule = line.split("=", 1)
+            metrics.append(Metric(name.strip(), rule))
+    return metrics
+
+
+def load_metrics(file_metrics: str) -> list[Metric]:
+    """ 内置四项指标在前, 其后为文件中定义的指标 """
+    metrics = parse_metrics(METRICS_DEFAULT)
+    if os.path.exists(file_metrics):
+        with open(file_metrics, 'r', encoding='utf-8') as fr:
+            metrics += parse_metrics(fr.read())
+    return metrics
+
+
+def join_codes(lines) -> bytes:
+    """ 编码行拼接为字节串(每行后接换行符, 非 ASCII 字符逐字替换为 '?') """
+    return "".join(line+"\n" for line in lines).encode('ascii', errors='replace')
+
+
+class PerfEngine:
+    """ 手感指标的批量计算
+    各布局的各项指标预先展开成按键二元组/三元组查找表, 编码流只需计数一遍, 所有布局的结果由计数与查找表相乘得到 """
+    def __init__(self, layouts: list[Layout]=None, metrics: list[Metric]=None):
+        self.layouts = layouts or [Layout.parse(LAYOUT_QWERTY)]
+        self.metrics = metrics or parse_metrics(METRICS_DEFAULT)
+        # 按键编号: 各布局中出现的键, 其后为"其他字符"和行分隔符
+        keys = sorted(set().union(*[layout.dict_key_pos for layout in self.layouts]))
+        self.size = len(keys) + 2
+        self.idx_sep = len(keys) + 1
+        self.lut = [len(keys)] * 128
+        for i, key in enumerate(keys):
+            self.lut[ord(key)] = i
+        self.lut[ord("\n")] = self.idx_sep
+        self.metrics2 = [m for m in self.metrics if m.n == 2]
+        self.metrics3 = [m for m in self.metrics if m.n == 3]
+        self.tables2, self.tables3 = [], []
+        for layout in self.layouts:
+            poses = [layout.dict_key_pos.get(key) for key in keys] + [None]
+            self.tables2 += [self._build_table(metric, poses) for metric in self.metrics2]
+            self.tables3 += [self._build_table(metric, poses) for metric in self.metrics3]
+        if np is not None:
+            self.lut_np = np.array(self.lut, dtype=np.int64)
+            self.matrix2 = np.array(self.tables2, dtype=np.int64).reshape(len(self.tables2), self.size**2)
+            self.matrix3 = np.array(self.tables3, dtype=np.int64).reshape(len(self.tables3), self.size**3)
+
+    def _build_table(self, metric: Metric, poses: list) -> list[int]:
+        """ 查找表 table[a*size+b](三元为 [(a*size+b)*size+c]), 含行分隔符的组合为 0 """
+        size, n = self.size, metric.n
+        table = [0] * size**n
+        rng = range(len(poses))
+        if n == 2:
+            for a in rng:
+                for b in rng:
+                    table[a*size+b] = metric.eval((poses[a], poses[b]))
+            return table
+        # 三元: 先用作用于前两键的条件剪枝
+        conds_12 = [cond for idx, cond in metric.conds if idx == (0, 1)]
+        for a in rng:
+            for b in rng:
+                if all(cond(poses[a], poses[b]) for cond in conds_12):
+                    for c in rng:
+                        table[(a*size+b)*size+c] = metric.eval((poses[a], poses[b], poses[c]))
+        return table
+
+    def count(self, data: bytes):
+        """ 统计字节串中的按键二元组和三元组, 返回按查找表下标排列的计数 """
+        size = self.size
+        if np is not None:
+            arr = self.lut_np[np.frombuffer(data, dtype=np.uint8)]
+            counts2 = np.bincount(arr[:-1] * size + arr[1:], minlength=size**2) if len(arr) > 1 else np.zeros(size**2, dtype=np.int64)
+            counts3 = None
+            if self.metrics3:
+                counts3 = np.bincount((arr[:-2] * size + arr[1:-1]) * size + arr[2:], minlength=size**3) \
+                    if len(arr) > 2 else np.zeros(size**3, dtype=np.int64)
+            return counts2, counts3
+        arr = data.translate(bytes(self.lut) + bytes(128))  # 按键均为 ASCII, 编号不超过 129
+        counts2 = {a*size+b: cnt for (a, b), cnt in Counter(zip(arr, arr[1:])).items()}
+        counts3 = None
+        if self.metrics3:
+            counts3 = {(a*size+b)*size+c: cnt for (a, b, c), cnt in Counter(zip(arr, arr[1:], arr[2:])).items()}
+        return counts2, counts3
+
+    def score(self, counts2, counts3=None) -> list[tuple[int]]:
+        """ 由计数得到每个布局的各项指标总数(指标顺序同 self.metrics) """
+        if np is not None:
+            res2 = (self.matrix2 @ counts2).reshape(len(self.layouts), -1).tolist()
+            res3 = (self.matrix3 @ counts3).reshape(len(self.layouts), -1).tolist() if self.metrics3 else [[]] * len(self.layouts)
+        else:
+            n2, n3 = len(self.metrics2), len(self.metrics3)
+            res2 = [[sum(table[i]*cnt for i, cnt in counts2.items()) for table in self.tables2[j*n2:(j+1)*n2]]
+                    for j in range(len(self.layouts))]
+            res3 = [[sum(table[i]*cnt for i, cnt in counts3.items()) for table in self.tables3[j*n3:(j+1)*n3]]
+                    for j in range(len(self.layouts))]
+        results = []
+        for row2, row3 in zip(res2, res3):
+            it2, it3 = iter(row2), iter(row3)
+            results.append(tuple(int(next(it2) if m.n == 2 else next(it3)) for m in self.metrics))
+        return results
+
+    def score_lines(self, lines) -> list[tuple[int]]:
+        return self.score(*self.count(join_codes(lines)))
+
+    def vectorize(self, ngrams2: dict, ngrams3: dict):
+        """ 按键 n 元组计数(NgramIndex.expand 的结果) -> 按查找表下标排列的计数 """
+        size, lut = self.size, self.lut
+        if np is not None:
+            def to_counts(ngrams, n):
+                keys = np.fromiter(ngrams.keys(), dtype=np.int64, count=len(ngrams))
+                cnts = np.fromiter(ngrams.values(), dtype=np.int64, count=len(ngrams))
+                idx = np.zeros(len(keys), dtype=np.int64)
+                for i in range(n-1, -1, -1):
+                    idx = idx * size + self.lut_np[(keys >> (7*i)) & 127]
+                return np.bincount(idx, weights=cnts, minlength=size**n).astype(np.int64)
+            return to_counts(ngrams2, 2), (to_counts(ngrams3, 3) if self.metrics3 else None)
+        counts2, counts3 = Counter(), Counter()
+        for k, cnt in ngrams2.items():
+            counts2[lut[k >> 7]*size + lut[k & 127]] += cnt
+        for k, cnt in ngrams3.items():
+            counts3[(lut[k >> 14]*size + lut[(k >> 7) & 127])*size + lut[k & 127]] += cnt
+        return counts2, (counts3 if self.metrics3 else None)
+
+
+class NgramIndex:
+    """ 语料的字频索引: 单字、相邻两字、相邻三字的出现次数(句末记为换行符, 其编码为上屏键 1)
+    与单字码表结合即可得到编码流中的按键二元组/三元组计数, 不必生成编码; 仅适用于一字一码的形码方案 """
+    def __init__(self, lines):
+        text = "".join(line+"\n" for line in lines)
+        if np is not None:
+            points = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+            vocab, ids = np.unique(points, return_inverse=True)
+            ids = ids.astype(np.int64).ravel()
+            size = len(vocab)
+            end = int(np.searchsorted(vocab, 10))
+            self.vocab = [chr(cp) for cp in vocab.tolist()]
+            self.uni = np.bincount(ids, minlength=size).astype(np.int64)
+            # 句末标记之后的组合跨句, 不计
+            mask = ids[:-1] != end
+            self.bi_keys, self.bi_cnts = np.unique((ids[:-1] * size + ids[1:])[mask], return_counts=True)
+            mask = (ids[:-2] != end) & (ids[1:-1] != end)
+            self.tri_keys, self.tri_cnts = np.unique(((ids[:-2] * size + ids[1:-1]) * size + ids[2:])[mask], return_counts=True)
+        else:
+            self.vocab = sorted(set(text))
+            dict_id = {char: i for i, char in enumerate(self.vocab)}
+            size = len(self.vocab)
+            end = dict_id.get("\n", -1)
+            ids = [dict_id[char] for char in text]
+            self.uni = [0] * size
+            for i, cnt in Counter(ids).items():
+                self.uni[i] = cnt
+            self.bi = Counter((a*size+b) for a, b in zip(ids, ids[1:]) if a != end)
+            self.tri = Counter((a*size+b)*size+c for a, b, c in zip(ids, ids[1:], ids[2:]) if a != end and b != end)
+
+    def _codes(self, dict_char_code: dict) -> list[bytes]:
+        try:
+            return [b"1" if char == "\n" else dict_char_code[char].encode('ascii', errors='replace') for char in self.vocab]
+        except KeyError as e:
+            raise UnicodeError("该字符的编码不存在："+e.args[0])
+
+    def expand(self, dict_char_code: dict, chars=None) -> tuple[Counter, Counter]:
+        """ 编码流中的按键二元组/三元组计数(按键按 ASCII 码每 7 位拼成整数)
+        chars 不为空时只统计含这些字的组合, 用于码表局部变化后的增量更新 """
+        size = len(self.vocab)
+        codes = self._codes(dict_char_code)
+        sel = [chars is None or char in chars for char in self.vocab]
+        ngrams2, ngrams3 = Counter(), Counter()
+        # 1.字内
+        for i, code in enumerate(codes):
+            if sel[i] and self.uni[i]:
+                for j in range(len(code)-1):
+                    ngrams2[code[j] << 7 | code[j+1]] += int(self.uni[i])
+                for j in range(len(code)-2):
+                    ngrams3[(code[j] << 7 | code[j+1]) << 7 | code[j+2]] += int(self.uni[i])
+        # 2.跨字: 两字间的二元组及含前字末两键或后字前两键的三元组, 以及中间字只有一键时跨三字的三元组
+        first = [code[0] for code in codes]
+        last = [code[-1] for code in codes]
+        second = [code[1] if len(code) > 1 else -1 for code in codes]
+        penult = [code[-2] if len(code) > 1 else -1 for code in codes]
+        if np is not None:
+            first, last, second, penult = [np.array(x, dtype=np.int64) for x in [first, last, second, penult]]
+            sel = np.array(sel, dtype=bool)
+
+            def add(ngrams, keys, cnts):
+                keys, inverse = np.unique(keys, return_inverse=True)
+                for k, cnt in zip(keys.tolist(), np.bincount(inverse.ravel(), weights=cnts).tolist()):
+                    ngrams[k] += int(cnt)
+            a, b = self.bi_keys // size, self.bi_keys % size
+            mask = sel[a] | sel[b]
+            a, b, cnts = a[mask], b[mask], self.bi_cnts[mask]
+            add(ngrams2, last[a] << 7 | first[b], cnts)
+            m = penult[a] >= 0
+            add(ngrams3, (penult[a][m] << 7 | last[a][m]) << 7 | first[b][m], cnts[m])
+            m = second[b] >= 0
+            add(ngrams3, (last[a][m] << 7 | first[b][m]) << 7 | second[b][m], cnts[m])
+            a, b, c = self.tri_keys // (size*size), self.tri_keys // size % size, self.tri_keys % size
+            mask = (second[b] < 0) & (sel[a] | sel[b] | sel[c])
+            add(ngrams3, (last[a][mask] << 7 | first[b][mask]) << 7 | first[c][mask], self.tri_cnts[mask])
+        else:
+            for k, cnt in self.bi.items():
+                a, b = divmod(k, size)
+                if sel[a] or sel[b]:
+                    ngrams2[last[a] << 7 | first[b]] += cnt
+                    if penult[a] >= 0:
+                        ngrams3[(penult[a] << 7 | last[a]) << 7 | first[b]] += cnt
+                    if second[b] >= 0:
+                        ngrams3[(last[a] << 7 | first[b]) << 7 | second[b]] += cnt
+            for k, cnt in self.tri.items():
+                ab, c = divmod(k, size)
+                a, b = divmod(ab, size)
+                if second[b] < 0 and (sel[a] or sel[b] or sel[c]):
+                    ngrams3[(last[a] << 7 | first[b]) << 7 | first[c]] += cnt
+        return ngrams2, ngrams3
+
+    def update(self, ngrams2: Counter, ngrams3: Counter, dict_old: dict, dict_new: dict):
+        """ 码表有少量变化时, 只重算含变化字的组合 """
+        chars = {char for char in self.vocab if char != "\n" and dict_old.get(char) != dict_new.get(char)}
+        if len(chars) > len(self.vocab) // 4:
+            return self.expand(dict_new)
+        if chars:
+            old2, old3 = self.expand(dict_old, chars)
+            new2, new3 = self.expand(dict_new, chars)
+            for ngrams, old, new in [(ngrams2, old2, new2), (ngrams3, old3, new3)]:
+                ngrams.subtract(old)
+                ngrams.update(new)
+                for k in [k for k, cnt in ngrams.items() if cnt == 0]:
+                    del ngrams[k]
+        return ngrams2, ngrams3
+
+    def count_chars(self) -> int:
+        return sum(int(cnt) for char, cnt in zip(self.vocab, self.uni) if char != "\n")
+
+    def count_codes(self, dict_char_code: dict) -> int:
+        """ 总码长(不含上屏键) """
+        return sum(int(cnt) * len(dict_char_code[char]) for char, cnt in zip(self.vocab, self.uni) if char != "\n")
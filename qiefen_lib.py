@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+
+class CodeIndex:
+    """ 码表的前缀索引: 查某串的哪些前缀是码, 以及哪些码以某串开头 """
+    def __init__(self, dict_code_chars: dict):
+        self.dict_code_chars = dict_code_chars
+        self.dict_prefix = defaultdict(list)  # 前缀: 以之开头且更长的码
+        for code in dict_code_chars:
+            for k in range(1, len(code)):
+                self.dict_prefix[code[:k]].append(code)
+
+    def prefixes_of(self, s: str) -> list[str]:
+        """ s 的真前缀中是码的 """
+        return [s[:k] for k in range(1, len(s)) if s[:k] in self.dict_code_chars]
+
+    def extensions_of(self, s: str) -> list[str]:
+        """ 以 s 开头且比 s 长的码 """
+        return self.dict_prefix.get(s, [])
+
+
+def find_ambiguities(index: CodeIndex, codes_start: list[str], len_max: int) -> list[tuple]:
+    """ 以 codes_start 中的码开头的切分歧义: 键位相同而切分不同的两组码 (长的首码一组, 短的首码一组)
+    只产出最简的歧义(两组的切分点除首尾外不重合), 总键数不超过 len_max """
+    list_res = []
+    for x in codes_start:
+        if len(x) > len_max:
+            continue
+        for y in index.prefixes_of(x):
+            _extend(index, [x], [y], x[len(y):], True, len(x), len_max, list_res)
+    return list_res
+
+
+def _extend(index, top, bottom, dangling, top_ahead, length, len_max, list_res):
+    # 领先的一组多出 dangling, 落后的一组接一个码: 恰好补齐、补不齐(仍落后)、或反超
+    behind = bottom if top_ahead else top
+    if dangling in index.dict_code_chars:
+        behind.append(dangling)
+        list_res.append((tuple(top), tuple(bottom)))
+        behind.pop()
+    for z in index.prefixes_of(dangling):
+        behind.append(z)
+        _extend(index, top, bottom, dangling[len(z):], top_ahead, length, len_max, list_res)
+        behind.pop()
+    for z in index.extensions_of(dangling):
+        if length + len(z) - len(dangling) <= len_max:
+            behind.append(z)
+            _extend(index, top, bottom, z[len(dangling):], not top_ahead, length + len(z) - len(dangling), len_max, list_res)
+            behind.pop()
+
+
+_index = None  # 子进程中的码表索引
+
+
+def _init_worker(dict_code_chars):
+    global _index
+    _index = CodeIndex(dict_code_chars)
+
+
+def _find_chunk(codes_start, len_max):
+    return find_ambiguities(_index, codes_start, len_max)
+
+
+def count_code_seqs(lines, dict_char_code: dict, seqs_needed: set, len_max: int) -> Counter:
+    """ 语料中各组码(按字切分)出现的次数, 只统计 seqs_needed 中的 """
+    counter = Counter()
+    for line in lines:
+        codes = [dict_char_code[char] for char in line]
+        for i in range(len(codes)):
+            total = 0
+            for j in range(i, len(codes)):
+                total += len(codes[j])
+                if total > len_max:
+                    break
+                seq = tuple(codes[i:j+1])
+                if seq in seqs_needed:
+                    counter[seq] += 1
+    return counter
+
+
+def analyze_qiefen(dict_char_code: dict, lines, len_max: int=0, num_workers: int=0, chunk_size: int=2000) -> tuple[list, int]:
+    """ 切分歧义分析: 找出总键数不超过 len_max(默认为最长码长的两倍)的全部最简歧义, 按语料中两种切分出现的次数排序
+    返回 ([(两种切分合计次数, 切分甲, 次数, 切分乙, 次数)], 歧义总数) """
+    dict_code_chars = defaultdict(list)
+    for char, code in dict_char_code.items():
+        dict_code_chars[code].append(char)
+    dict_code_chars = dict(dict_code_chars)
+    if not len_max:
+        len_max = 2 * max(map(len, dict_code_chars), default=1)
+    codes = sorted(dict_code_chars)
+    chunks = [codes[i:i+chunk_size] for i in range(0, len(codes), chunk_size)]
+    list_amb = []
+    if num_workers == 1 or len(chunks) <= 1:
+        index = CodeIndex(dict_code_chars)
+        for chunk in chunks:
+            list_amb += find_ambiguities(index, chunk, len_max)
+    else:
+        # 码表在子进程启动时传入一次, 各进程分别建索引
+        with ProcessPoolExecutor(max_workers=min(num_workers or os.cpu_count() or 1, len(chunks)),
+                                 initializer=_init_worker, initargs=(dict_code_chars,)) as executor:
+            for res in executor.map(_find_chunk, chunks, [len_max]*len(chunks)):
+                list_amb += res
+    counter = count_code_seqs(lines, dict_char_code, {seq for amb in list_amb for seq in amb}, len_max)
+    list_ranked = []
+    for seq_a, seq_b in list_amb:
+        cnt_a, cnt_b = counter[seq_a], counter[seq_b]
+        if cnt_a or cnt_b:
+            list_ranked.append((cnt_a + cnt_b, seq_a, cnt_a, seq_b, cnt_b))
+    list_ranked.sort(key=lambda t: (-t[0], "".join(t[1]), t[1], t[3]))
+    return list_ranked, len(list_amb)
+
+
+def format_seq(seq: tuple, dict_code_chars: dict) -> str:
+    """ 一组码及其首选字, 如 "ab cde(春天)" """
+    return " ".join(seq) + "(" + "".join(dict_code_chars[code][0] for code in seq) + ")"
+
+
+def save_qiefen(file_out: str, list_ranked: list, dict_char_code: dict):
+    """ 写出排好序的歧义报告: 键位, 合计次数, 切分甲(首选字), 次数, 切分乙(首选字), 次数 """
+    dict_code_chars = defaultdict(list)
+    for char, code in dict_char_code.items():
+        dict_code_chars[code].append(char)
+    with open(file_out, 'w', encoding='utf-8') as fw:
+        fw.write("键位\t合计\t切分甲\t次数\t切分乙\t次数\n")
+        for cnt, seq_a, cnt_a, seq_b, cnt_b in list_ranked:
+            fw.write(f"{''.join(seq_a)}\t{cnt}\t{format_seq(seq_a, dict_code_chars)}\t{cnt_a}\t"
+                     f"{format_seq(seq_b, dict_code_chars)}\t{cnt_b}\n")
@@ -0,0 +1,554 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import queue
+import ctypes
+import ctypes.util
+import shutil
+import threading
+import subprocess
+from collections import deque
+from time import perf_counter
+from cache_lib import hash_files
+
+
+MARK_COMMIT = b"commit:"
+# 核对标记: 每批编码后输入 "set option 标记名", 控制台回显 "标记名 set on."(只设一个会话选项, 不输入按键)
+MARK_SYNC = "autorime_sync_"
+RE_EVENT = re.compile(MARK_COMMIT + rb"|" + MARK_SYNC.encode('ascii') + rb"(\d+) set on\.")
+MAX_RETRY = 2  # 上屏结果为乱码时, 在同一进程中重新输入的次数
+_EXIT = object()  # 通知写入线程结束输入
+
+
+def iter_events(stream, size_chunk: int=1<<16):
+    """ 从控制台输出的字节流中逐个取出上屏内容(str)和核对标记的序号(int)
+    以 commit: 为界重新同步: 内容到换行或下一个 commit: 为止, 不依赖完整的行, 也不受其他输出中坏字节的影响 """
+    buf = b""
+    while True:
+        chunk = stream.read1(size_chunk)
+        if not chunk:
+            break
+        buf += chunk
+        while True:
+            m = RE_EVENT.search(buf)
+            if m is None:
+                buf = buf[-64:]  # 保留可能被截断的标记
+                break
+            if m.group(1) is not None:
+                yield int(m.group(1))
+                buf = buf[m.end():]
+                continue
+            pos = m.start()
+            pos_nl = buf.find(b"\n", pos)
+            pos_next = buf.find(MARK_COMMIT, pos+len(MARK_COMMIT))
+            if pos_nl < 0 and pos_next < 0:
+                buf = buf[pos:]  # 内容尚未读完整
+                break
+            end = pos_nl if pos_next < 0 or 0 <= pos_nl < pos_next else pos_next
+            yield decode_commit(buf[pos+len(MARK_COMMIT):end])
+            buf = buf[end:]
+    pos = buf.find(MARK_COMMIT)
+    if pos > -1:
+        yield decode_commit(buf[pos+len(MARK_COMMIT):])
+
+
+def decode_commit(raw: bytes) -> str:
+    return raw.decode('utf-8', errors='replace').strip()
+
+
+class ConsoleWorker:
+    """ 常驻的 rime_api_console 进程(使用独立的用户目录)
+    每批编码后输入一个核对标记, 读到标记时其前的上屏结果数须与编码数相符, 核对过的结果才产出;
+    上屏结果为乱码的句子立即在本进程中重新输入, 结果仍按输入顺序产出 """
+    def __init__(self, file_exe: str | list, dir_user: str, wid: int=0, dir_src: str="", timeout_idle: float=10.0,
+                 key_src: str=""):
+        self.file_exe = file_exe
+        self.dir_user = dir_user
+        self.dir_src = dir_src  # 不为空时, 启动前先从此处拷贝一份用户目录
+        self.key_src = key_src  # dir_src 的摘要: 与上次拷贝时一致则复用已有的拷贝
+        self.wid = wid
+        self.timeout_idle = timeout_idle  # 输入结束后长时间没有新的上屏结果, 视为进程不再输出
+        self.interval_fill = 0.2  # 输入结束后等待重试结果时, 每隔这么久补一次填充标记
+        self.size_fill = 512  # 每次补的填充标记数(回显的字节数要超过控制台的输出缓冲)
+        self.process = None
+        self.queue_in = queue.Queue()  # 待输入的编码(按批), 以及需要重新输入的句子
+        self.slots = threading.Semaphore(2)  # 最多积压两批编码
+        self.queue_out = queue.Queue()  # 核对过的上屏结果, None 表示进程已退出
+        self.lock = threading.Lock()
+        self.deque_sent = deque()  # 已输入、尚未读到结果的 (序号, 编码, 已重试次数) 和核对标记的序号
+        self.id_sync = 0  # 下一个核对标记的序号
+        self.cnt_pending = 0  # 尚未得到最终结果的句子数
+        self.cnt_retrying = 0  # 正在重新输入的句子数
+        self.input_done = False
+        self.error = ""  # 输出与输入对不上时的说明
+        self.cnt_lines = 0
+        self.cnt_read = 0
+        self.cnt_retry = 0
+        self.cnt_missing = 0
+        self.time_start = 0.0
+        self.time_end = 0.0
+
+    def start(self):
+        if self.dir_src:
+            self._copy_src()
+        cmd = self.file_exe if isinstance(self.file_exe, list) else [self.file_exe]  # 也可传入完整命令(如替身脚本)
+        self.process = subprocess.Popen(cmd, cwd=self.dir_user,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.time_start = perf_counter()
+        threading.Thread(target=self._write, daemon=True).start()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _copy_src(self):
+        """ 拷贝用户目录; 摘要未变时只把用户词库恢复成源目录中的样子, 不再整个拷贝 """
+        file_key = os.path.join(self.dir_user, '.autorime_src')
+        key_old = ""
+        if self.key_src and os.path.exists(file_key):
+            with open(file_key, 'r', encoding='utf-8') as fr:
+                key_old = fr.read().strip()
+        if key_old != self.key_src or not self.key_src:
+            if os.path.exists(self.dir_user):
+                shutil.rmtree(self.dir_user)
+            shutil.copytree(self.dir_src, self.dir_user)
+            if self.key_src:
+                with open(file_key, 'w', encoding='utf-8') as fw:
+                    fw.write(self.key_src)
+            return
+        # 上次模拟可能改动了用户词库
+        for fname in os.listdir(self.dir_user):
+            if fname.endswith('.userdb'):
+                path = os.path.join(self.dir_user, fname)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+        for fname in os.listdir(self.dir_src):
+            if fname.endswith('.userdb'):
+                path = os.path.join(self.dir_src, fname)
+                if os.path.isdir(path):
+                    shutil.copytree(path, os.path.join(self.dir_user, fname))
+                else:
+                    shutil.copy(path, self.dir_user)
+
+    def put(self, batch):
+        self.slots.acquire()
+        self.queue_in.put(batch)
+
+    def _write(self):
+        seq = 0
+        cnt_read_last, time_idle = 0, 0.0
+        try:
+            while True:
+                try:
+                    item = self.queue_in.get(timeout=self.interval_fill if self.input_done else None)
+                except queue.Empty:
+                    # 输入已结束, 还有句子在重试: 控制台输出到管道时带缓冲, 补一些填充标记把结果挤出来;
+                    # 长时间仍没有新结果(比如进程卡住)则不再等待, 退出时控制台会输出缓冲中的全部内容, 由读取端核对
+                    if self.cnt_read != cnt_read_last:
+                        cnt_read_last, time_idle = self.cnt_read, 0.0
+                    time_idle += self.interval_fill
+                    if time_idle >= self.timeout_idle:
+                        break
+                    if self.cnt_retrying:
+                        self._send([], self.size_fill)
+                    continue
+                if item is _EXIT:
+                    break
+                if item is None:
+                    # 全部编码已分配, 等重新输入的句子都有结果后再退出
+                    with self.lock:
+                        self.input_done = True
+                        done = self.cnt_pending == 0
+                    if done:
+                        break
+                    # 只补一次填充标记, 把最后几批的结果挤出来
+                    cnt_read_last = self.cnt_read
+                    self._send([], self.size_fill)
+                    continue
+                if isinstance(item, tuple):
+                    # 重新输入的句子(输入结束后则紧接填充标记)
+                    self._send([item], self.size_fill if self.input_done else 1)
+                    continue
+                self._send([(seq+i, code, 0) for i, code in enumerate(item)])
+                seq += len(item)
+                self.cnt_lines += len(item)
+                self.slots.release()
+            self.process.stdin.write(b"\nexit\n")
+            self.process.stdin.close()
+        except OSError:
+            # 进程提前退出, 由读取端负责报告
+            pass
+
+    def _send(self, items: list, cnt_sync: int=1):
+        """ 输入编码, 其后接 cnt_sync 个核对标记(items 为空时只输入标记, 用作填充) """
+        with self.lock:
+            ids = range(self.id_sync, self.id_sync+cnt_sync)
+            self.id_sync += cnt_sync
+            self.deque_sent.extend(items)
+            self.deque_sent.extend(ids)
+            if items and items[0][2] == 0:
+                self.cnt_pending += len(items)
+        text = "".join(code+"\n" for _, code, _ in items) + "".join(f"set option {MARK_SYNC}{i}\n" for i in ids)
+        self.process.stdin.write(text.encode('utf-8'))
+        self.process.stdin.flush()
+
+    def _read(self):
+        dict_result = {}
+        seq_next = 0
+        unit = []  # 上一个核对标记之后读到的 (序号, 编码, 已重试次数, 上屏结果)
+        for event in iter_events(self.process.stdout):
+            with self.lock:
+                item = self.deque_sent.popleft() if self.deque_sent else None
+            if isinstance(event, str):
+                self.cnt_read += 1
+                if not isinstance(item, tuple):
+                    self.error = f"Rime 进程 {self.wid} 的输出行数多于输入行数，请检查"
+                    break
+                unit.append((*item, event))
+                continue
+            if item != event:
+                # 标记前还有编码没有读到上屏结果: 这一批的结果已与输入错位, 不再产出
+                if isinstance(item, tuple):
+                    with self.lock:
+                        cnt_lack = 1
+                        while self.deque_sent and isinstance(self.deque_sent[0], tuple):
+                            self.deque_sent.popleft()
+                            cnt_lack += 1
+                    self.error = (f"Rime 进程 {self.wid} 的输出行数少于输入行数"
+                                  f"(一批 {len(unit)+cnt_lack} 个编码只读到 {len(unit)} 个上屏结果)，请检查")
+                else:
+                    self.error = f"Rime 进程 {self.wid} 的输出行数多于输入行数，请检查"
+                break
+            for seq, code, cnt, text in unit:
+                if "\ufffd" in text and cnt < MAX_RETRY:
+                    self.cnt_retry += 1
+                    if cnt == 0:
+                        with self.lock:
+                            self.cnt_retrying += 1
+                    self.queue_in.put((seq, code, cnt+1))
+                    continue
+                dict_result[seq] = text
+                with self.lock:
+                    self.cnt_pending -= 1
+                    if cnt:
+                        self.cnt_retrying -= 1
+            unit = []
+            while seq_next in dict_result:
+                self.queue_out.put(dict_result.pop(seq_next))
+                seq_next += 1
+            with self.lock:
+                finished = self.input_done and self.cnt_pending == 0
+            if finished:
+                self.queue_in.put(_EXIT)
+        if self.error:
+            self.process.kill()
+            self.queue_in.put(_EXIT)
+        self.process.stdout.close()
+        self.process.wait()
+        self.time_end = perf_counter()
+        self.cnt_missing = len(unit) + sum(1 for item in self.deque_sent if isinstance(item, tuple))  # 没有核对过的输入
+        self.queue_out.put(None)
+
+
+class ConsolePool:
+    """ 多个 rime_api_console 进程并行模拟, 结果按输入顺序合并 """
+    def __init__(self, file_exe: str | list, dir_schema: str, dir_workers: str, num_workers: int=0, chunk_size: int=200,
+                 key_schema: str=""):
+        self.file_exe = file_exe
+        self.dir_schema = dir_schema
+        self.dir_workers = dir_workers
+        self.key_schema = key_schema  # 方案文件和部署结果的摘要, 不为空时各进程的用户目录只在其变化后重新拷贝
+        self.num_workers = num_workers if num_workers > 0 else (os.cpu_count() or 1)
+        self.chunk_size = chunk_size
+        self.workers = []
+        self.desc = f"{self.num_workers} 个 rime_api_console 进程"
+
+    def _create_workers(self) -> list[ConsoleWorker]:
+        # 单进程直接使用部署目录; 多进程则各自拷贝一份(用户词库不能被多个进程同时打开)
+        if self.num_workers == 1:
+            return [ConsoleWorker(self.file_exe, self.dir_schema)]
+        # 以往进程数更多时留下的拷贝
+        if os.path.isdir(self.dir_workers):
+            for fname in os.listdir(self.dir_workers):
+                if fname.startswith("worker_") and fname[7:].isdigit() and int(fname[7:]) >= self.num_workers:
+                    shutil.rmtree(os.path.join(self.dir_workers, fname), ignore_errors=True)
+        return [ConsoleWorker(self.file_exe, os.path.join(self.dir_workers, f"worker_{i}"), i, self.dir_schema, key_src=self.key_schema)
+                for i in range(self.num_workers)]
+
+    def run(self, lines_code):
+        """ 逐行输入编码(不含换行), 按输入顺序逐个产出上屏结果
+        只产出已核对过的结果: 中途出错时, 已产出的结果都与输入对齐, 调用方可放心保存 """
+        self.workers = self._create_workers()
+        queue_order = queue.Queue()
+        errors = []
+
+        def put(k, batch):
+            # 进程在分到第一批编码时才启动, 没有需要模拟的句子时不必启动
+            if self.workers[k].process is None:
+                self.workers[k].start()
+            self.workers[k].put(batch)
+            queue_order.put((k, len(batch)))
+
+        def dispatch():
+            # 按批轮流分配给各进程, 同时记录分配顺序以便合并
+            try:
+                batch, k = [], 0
+                for code in lines_code:
+                    batch.append(code)
+                    if len(batch) >= self.chunk_size:
+                        put(k, batch)
+                        batch, k = [], (k+1) % self.num_workers
+                if batch:
+                    put(k, batch)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                for worker in self.workers:
+                    if worker.process is not None:
+                        worker.queue_in.put(None)
+                queue_order.put(None)
+
+        threading.Thread(target=dispatch, daemon=True).start()
+        try:
+            while True:
+                item = queue_order.get()
+                if item is None:
+                    break
+                k, n = item
+                for _ in range(n):
+                    line_out = self.workers[k].queue_out.get()
+                    if line_out is None:
+                        raise BaseException(self.workers[k].error or f"Rime 进程 {k} 的输出行数少于输入行数，请检查")
+                    yield line_out
+            if errors:
+                raise errors[0]
+            for worker in self.workers:
+                if worker.process is None:
+                    continue
+                worker.queue_out.get()  # 等读取端结束
+                if worker.error:
+                    raise BaseException(worker.error)
+                if worker.cnt_missing:
+                    raise BaseException(f"Rime 进程 {worker.wid} 的输出行数少于输入行数，请检查")
+                if worker.process.returncode != 0:
+                    raise BaseException(f"Rime 进程 {worker.wid} 异常退出(返回值 {worker.process.returncode})")
+        finally:
+            for worker in self.workers:
+                if worker.process is not None and worker.process.poll() is None:
+                    worker.process.kill()
+
+    def report(self):
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            elapsed = max(worker.time_end - worker.time_start, 1e-6)
+            retry = f", 乱码重试 {worker.cnt_retry} 次" if worker.cnt_retry else ""
+            print(f"  进程 {worker.wid}: {worker.cnt_lines} 行, {round(worker.cnt_lines / elapsed, 1)} 行/秒{retry}")
+
+
+class DeployManager:
+    """ 部署 Rime 方案: 方案文件未变化时跳过, 需要部署时在后台进行 """
+    # 部署和使用过程中 Rime 自己生成的文件, 不参与比较
+    dirs_skip = {'build', 'sync'}
+    files_skip = {'user.yaml', 'installation.yaml'}
+
+    def __init__(self, file_exe: str, dir_schema: str, file_fingerprint: str, file_log: str):
+        self.file_exe = file_exe
+        self.dir_schema = dir_schema
+        self.file_fingerprint = file_fingerprint
+        self.file_log = file_log
+        self.process = None
+        self.fw_log = None
+        self.fp = ""
+
+    def fingerprint(self) -> str:
+        """ 方案相关文件(schema、dict、opencc 等)的摘要 """
+        files = []
+        for dir_cur, dirs, fnames in os.walk(self.dir_schema):
+            dirs[:] = sorted(d for d in dirs if d not in self.dirs_skip and not d.endswith('.userdb'))
+            files += [os.path.join(dir_cur, f) for f in sorted(fnames) if f not in self.files_skip]
+        rel_names = "\n".join(os.path.relpath(f, self.dir_schema) for f in files)
+        return hash_files(*files, extra=rel_names)
+
+    def start(self):
+        self.fp = self.fingerprint()
+        fp_old = ""
+        if os.path.exists(self.file_fingerprint):
+            with open(self.file_fingerprint, 'r', encoding='utf-8') as fr:
+                fp_old = fr.read().strip()
+        if fp_old == self.fp and os.path.isdir(os.path.join(self.dir_schema, 'build')):
+            print("Rime 方案文件未变化, 跳过部署")
+            return
+        print("正在后台部署 Rime 方案...", flush=True)
+        self.fw_log = open(self.file_log, 'w', encoding='utf-8')
+        self.process = subprocess.Popen([self.file_exe, '--build'], cwd=self.dir_schema,
+                                        stdout=self.fw_log, stderr=subprocess.STDOUT)
+
+    def wait(self):
+        """ 等待部署完成(没有在部署时直接返回) """
+        if self.process is None:
+            return
+        returncode = self.process.wait()
+        self.process = None
+        self.fw_log.close()
+        if returncode != 0:
+            raise BaseException(f"Rime 部署失败(返回值 {returncode}), 详见 {self.file_log}")
+        with open(self.file_fingerprint, 'w', encoding='utf-8') as fw:
+            fw.write(self.fp)
+        print("Rime 部署完毕")
+
+
+class RimeTraits(ctypes.Structure):
+    _fields_ = [("data_size", ctypes.c_int),
+                ("shared_data_dir", ctypes.c_char_p),
+                ("user_data_dir", ctypes.c_char_p),
+                ("distribution_name", ctypes.c_char_p),
+                ("distribution_code_name", ctypes.c_char_p),
+                ("distribution_version", ctypes.c_char_p),
+                ("app_name", ctypes.c_char_p),
+                ("modules", ctypes.POINTER(ctypes.c_char_p)),
+                ("min_log_level", ctypes.c_int),
+                ("log_dir", ctypes.c_char_p),
+                ("prebuilt_data_dir", ctypes.c_char_p),
+                ("staging_dir", ctypes.c_char_p)]
+
+
+class RimeCommit(ctypes.Structure):
+    _fields_ = [("data_size", ctypes.c_int),
+                ("text", ctypes.c_char_p)]
+
+
+def find_librime(dir_librime: str) -> str:
+    """ 查找 librime 动态库: 优先 librime_x86/bin 下的, 其次系统安装的 """
+    if sys.platform == 'win32':
+        names = ['rime.dll']
+    elif sys.platform == 'darwin':
+        names = ['librime.1.dylib', 'librime.dylib']
+    else:
+        names = ['librime.so.1', 'librime.so']
+    for sub in ['bin', 'lib']:
+        for name in names:
+            file_lib = os.path.join(os.path.join(dir_librime, sub), name)
+            if os.path.exists(file_lib):
+                return file_lib
+    return ctypes.util.find_library('rime') or ""
+
+
+class LibrimeEngine:
+    """ 通过 ctypes 直接调用 librime 动态库模拟(进程内, 无文件和管道中转)
+
+    只用到 librime 导出的 C 函数(RimeSetup/RimeSimulateKeySequence/RimeGetCommit 等),
+    因此也可以换成导出同名函数的桩库来测试.
+    """
+    _setup_done = False  # RimeSetup 每个进程只能调用一次
+
+    def __init__(self, file_lib: str, dir_schema: str):
+        self.file_lib = file_lib
+        self.dir_schema = dir_schema
+        self.num_workers = 1
+        self.desc = "librime 动态库(进程内)"
+        self.cnt_lines = 0
+        self.cnt_retry = 0
+        self.time_busy = 0.0
+        self.profile = False  # 为 True 时, 每产出一个结果即在 latencies 末尾追加其耗时(秒)
+        self.latencies = deque()
+        if not file_lib:
+            raise OSError("未找到 librime 动态库")
+        try:
+            self.lib = ctypes.CDLL(file_lib)
+            self._bind()
+        except (OSError, AttributeError) as e:
+            raise OSError(f"librime 动态库加载失败: {file_lib} ({str(e)})")
+
+    def _bind(self):
+        lib = self.lib
+        session_id = ctypes.c_size_t  # RimeSessionId 即 uintptr_t
+        p_traits = ctypes.POINTER(RimeTraits)
+        p_commit = ctypes.POINTER(RimeCommit)
+        for name, restype, argtypes in [
+                ("RimeSetup", None, [p_traits]),
+                ("RimeInitialize", None, [p_traits]),
+                ("RimeFinalize", None, []),
+                ("RimeStartMaintenance", ctypes.c_int, [ctypes.c_int]),
+                ("RimeJoinMaintenanceThread", None, []),
+                ("RimeCreateSession", session_id, []),
+                ("RimeDestroySession", ctypes.c_int, [session_id]),
+                ("RimeSimulateKeySequence", ctypes.c_int, [session_id, ctypes.c_char_p]),
+                ("RimeGetCommit", ctypes.c_int, [session_id, p_commit]),
+                ("RimeFreeCommit", ctypes.c_int, [p_commit]),
+                ("RimeClearComposition", None, [session_id])]:
+            func = getattr(lib, name)
+            func.restype = restype
+            func.argtypes = argtypes
+
+    def _start(self):
+        dir_data = self.dir_schema.encode('utf-8')
+        self.traits = RimeTraits()
+        self.traits.data_size = ctypes.sizeof(RimeTraits) - ctypes.sizeof(ctypes.c_int)
+        self.traits.shared_data_dir = dir_data
+        self.traits.user_data_dir = dir_data
+        self.traits.distribution_name = b"AutoRime"
+        self.traits.distribution_code_name = b"AutoRime"
+        self.traits.distribution_version = b"1.0"
+        self.traits.app_name = b"rime.autorime"
+        self.traits.min_log_level = 3  # 只记录 FATAL
+        if not LibrimeEngine._setup_done:
+            self.lib.RimeSetup(ctypes.byref(self.traits))
+            LibrimeEngine._setup_done = True
+        self.lib.RimeInitialize(ctypes.byref(self.traits))
+        # 已由 rime_deployer 部署, 这里只做快速检查
+        if self.lib.RimeStartMaintenance(0):
+            self.lib.RimeJoinMaintenanceThread()
+        self.session = self.lib.RimeCreateSession()
+        if not self.session:
+            self.lib.RimeFinalize()
+            raise BaseException("librime 会话创建失败")
+
+    def _stop(self):
+        self.lib.RimeDestroySession(self.session)
+        self.lib.RimeFinalize()
+
+    def type_line(self, code: str):
+        """ 输入一行编码(含末尾的选重键), 返回上屏的文字, 未上屏时返回 None """
+        text = None
+        self.lib.RimeSimulateKeySequence(self.session, code.encode('utf-8'))
+        commit = RimeCommit()
+        commit.data_size = ctypes.sizeof(RimeCommit) - ctypes.sizeof(ctypes.c_int)
+        if self.lib.RimeGetCommit(self.session, ctypes.byref(commit)):
+            text = commit.text.decode('utf-8', errors='replace').strip()
+            self.lib.RimeFreeCommit(ctypes.byref(commit))
+        # 未完全上屏的残留编码不能带入下一句
+        self.lib.RimeClearComposition(self.session)
+        return text
+
+    def run(self, lines_code):
+        """ 与 ConsolePool.run 接口一致 """
+        started = False
+        start = perf_counter()
+        try:
+            for code in lines_code:
+                if not started:
+                    # 没有需要模拟的句子时不必初始化
+                    self._start()
+                    started = True
+                self.cnt_lines += 1
+                time_sent = perf_counter()
+                text = self.type_line(code)
+                for _ in range(MAX_RETRY):
+                    if text is None or "\ufffd" not in text:
+                        break
+                    self.cnt_retry += 1
+                    text = self.type_line(code)
+                if self.profile:
+                    self.latencies.append(perf_counter() - time_sent)
+                yield text
+        finally:
+            self.time_busy += perf_counter() - start
+            if started:
+                self._stop()
+
+    def report(self):
+        retry = f", 乱码重试 {self.cnt_retry} 次" if self.cnt_retry else ""
+        print(f"  librime: {self.cnt_lines} 行, {round(self.cnt_lines / max(self.time_busy, 1e-6), 1)} 行/秒{retry}")
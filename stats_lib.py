@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import math
+import heapq
+import random
+import sqlite3
+from bisect import bisect_right
+from time import strftime
+from array import array
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:  # 没有 numpy 时逐项求和, 结果相同
+    np = None
+
+STATS_VERSION = "2"  # 统计口径变化时递增, 使旧的断点和分片进度失效(2: 综合准确率按编辑距离对齐)
+PERCENTILES = (50, 90, 99)
+BUCKETS_LEN = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30)  # 按字数分组时各组的起点
+SEED_SAMPLE = 0  # 抽样的随机种子, 固定以便结果可复现
+Z_95 = 1.959964  # 95% 置信区间的正态分位数
+
+
+def common_prefix(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _banded_distance(a: str, b: str, k: int) -> int:
+    """ 只计算主对角线两侧各 k 格内的编辑距离, 真实距离不超过 k 时结果准确, 否则返回大于 k 的值 """
+    la, lb = len(a), len(b)
+    big = la + lb + 1
+    prev = [j if j <= k else big for j in range(lb+1)]
+    cur = [big] * (lb+1)
+    for i in range(1, la+1):
+        lo, hi = max(1, i-k), min(lb, i+k)
+        cur[lo-1] = i if lo == 1 and i <= k else big
+        ca = a[i-1]
+        best = big
+        for j in range(lo, hi+1):
+            v = prev[j-1] + (ca != b[j-1])
+            if prev[j] + 1 < v:
+                v = prev[j] + 1
+            if cur[j-1] + 1 < v:
+                v = cur[j-1] + 1
+            cur[j] = v
+            if v < best:
+                best = v
+        if hi < lb:
+            cur[hi+1] = big
+        if best > k:
+            return big
+        prev, cur = cur, prev
+    return prev[lb]
+
+
+def edit_distance(a: str, b: str) -> int:
+    """ 编辑距离(增、删、改各计 1): 先去掉相同的首尾, 再在对角带内计算, 带宽不够时加倍(结果与完整计算相同) """
+    i = common_prefix(a, b)
+    a, b = a[i:], b[i:]
+    j = 0
+    n = min(len(a), len(b))
+    while j < n and a[-1-j] == b[-1-j]:
+        j += 1
+    if j:
+        a, b = a[:-j], b[:-j]
+    if not a or not b:
+        return len(a) + len(b)
+    k = max(abs(len(a) - len(b)), 1)
+    while True:
+        d = _banded_distance(a, b, k)
+        if d <= k:
+            return d
+        k *= 2
+
+
+def align_errors(a: str, b: str, dist: int=-1) -> list[tuple]:
+    """ 按编辑距离对齐输入 a 和输出 b, 返回各处错误 [(输入起点, 输入终点, 输出起点, 输出终点)]
+    相邻的增、删、改合为一处; dist 为已算出的编辑距离(没有时现算), 最优对齐不会偏离对角线超过 dist,
+    只在去掉相同首尾后的部分、对角线两侧各 dist 格内计算和回溯(结果与完整计算相同) """
+    p = common_prefix(a, b)
+    q = 0
+    while q < min(len(a), len(b)) - p and a[-1-q] == b[-1-q]:
+        q += 1
+    ma, mb = a[p:len(a)-q], b[p:len(b)-q]
+    la, lb = len(ma), len(mb)
+    k = min(dist if dist >= 0 else edit_distance(ma, mb), max(la, lb))
+    big = la + lb + 1
+    # rows[i][j-i+k] 即 dp[i][j], 带外的格子为 big
+    rows = [[big] * (2*k+1) for _ in range(la+1)]
+    for i in range(la+1):
+        row, prev = rows[i], rows[i-1]
+        for j in range(max(0, i-k), min(lb, i+k)+1):
+            t = j - i + k
+            if i == 0 or j == 0:
+                row[t] = i + j
+                continue
+            v = prev[t] + (ma[i-1] != mb[j-1])
+            if t < 2*k and prev[t+1] + 1 < v:
+                v = prev[t+1] + 1
+            if t > 0 and row[t-1] + 1 < v:
+                v = row[t-1] + 1
+            row[t] = v
+
+    def dp(i, j):
+        t = j - i + k
+        return rows[i][t] if 0 <= t <= 2*k else big
+
+    # 回溯, 得到各位置是否对齐正确
+    list_err = []
+    i, j = la, lb
+    end = None  # 当前错误段的 (输入终点, 输出终点)
+    while i > 0 or j > 0:
+        v = dp(i, j)
+        v_diag = dp(i-1, j-1) if i > 0 and j > 0 else big
+        if v_diag == v and ma[i-1] == mb[j-1]:
+            if end:
+                list_err.append((p+i, p+end[0], p+j, p+end[1]))
+                end = None
+            i, j = i-1, j-1
+            continue
+        if not end:
+            end = (i, j)
+        if v_diag + 1 == v:
+            i, j = i-1, j-1
+        elif i > 0 and dp(i-1, j) + 1 == v:
+            i -= 1
+        else:
+            j -= 1
+    if end:
+        list_err.append((p, p+end[0], p, p+end[1]))
+    list_err.reverse()
+    return list_err
+
+
+class ErrorIndex:
+    """ 错误模式索引: 错字句与输入对齐后, 按 (编码片段, 输入片段, 错误输出) 累计次数, 存入 SQLite
+    按 (运行条件, 文章, 分片) 整体替换, 重跑或续跑不会重复累计; 查询时可跨多次运行汇总 """
+    def __init__(self, file_db: str, run: str="", desc: str=""):
+        self.run = run
+        self.desc = desc
+        self.dict_counter = {}  # (文章, 分片号): Counter((编码片段, 输入片段, 错误输出)), 分片号 -1 表示整篇
+        self.conn = sqlite3.connect(file_db)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS errors (run TEXT, article TEXT, part INTEGER, code TEXT, seg_in TEXT, "
+                          "seg_out TEXT, cnt INTEGER, PRIMARY KEY (run, article, part, code, seg_in, seg_out))")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS errors_code ON errors (code, seg_in, seg_out)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS runs (run TEXT PRIMARY KEY, desc TEXT, time TEXT)")
+
+    def add(self, article: str, line_in: str, line_out: str, codes: list[str], part: int=-1, dist: int=-1):
+        """ codes 为输入各字的编码, dist 为两句的编辑距离(可沿用统计时算出的); 多打的字并入左邻(句首则右邻)的字, 使每处错误都有对应的编码 """
+        counter = self.dict_counter.setdefault((article, part), Counter())
+        for i0, i1, j0, j1 in align_errors(line_in, line_out, dist):
+            if i0 == i1:
+                if i0 > 0:
+                    i0, j0 = i0-1, j0-1
+                elif i1 < len(line_in):
+                    i1, j1 = i1+1, j1+1
+                else:
+                    continue
+            counter["".join(codes[i0:i1]), line_in[i0:i1], line_out[j0:j1]] += 1
+
+    def flush(self, article: str, part: int=-1):
+        """ 写入一篇文章(或一个分片)的错误, 替换以往在同一运行条件下的记录(整篇和分片的记录互相替换) """
+        counter = self.dict_counter.pop((article, part), Counter())
+        self.conn.execute("DELETE FROM errors WHERE run = ? AND article = ? AND (part = ? OR part = -1 OR ? = -1)",
+                          (self.run, article, part, part))
+        self.conn.executemany("INSERT INTO errors VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              [(self.run, article, part, *k, cnt) for k, cnt in counter.items()])
+        self.conn.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, ?)", (self.run, self.desc, strftime("%Y-%m-%d %H:%M:%S")))
+        self.conn.commit()
+
+    def clear(self, article: str):
+        """ 删除一篇文章在同一运行条件下的全部记录(分片模式从头开始时) """
+        self.conn.execute("DELETE FROM errors WHERE run = ? AND article = ?", (self.run, article))
+        self.conn.commit()
+
+    def count_runs(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    def top(self, k: int=20, run: str=None) -> list[tuple]:
+        """ 出错最多的 (编码片段, 输入片段, 错误输出, 次数), run 为空时汇总全部运行 """
+        sql_where, args = ("WHERE run = ?", (run,)) if run else ("", ())
+        return self.conn.execute(f"SELECT code, seg_in, seg_out, SUM(cnt) AS n FROM errors {sql_where} "
+                                 "GROUP BY code, seg_in, seg_out ORDER BY n DESC LIMIT ?", (*args, k)).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+class SentenceStats:
+    """ 逐句统计结果的列存储: 字数、码长、是否上屏、是否完全正确、编辑距离、首错位置(-1 表示无错)
+    汇总时对各列一次求和; 综合准确率按编辑距离对齐计算, 漏字、多字只影响附近的字 """
+    def __init__(self):
+        self.len_in = array('I')
+        self.len_code = array('I')
+        self.committed = array('B')
+        self.exact = array('B')
+        self.dist = array('I')
+        self.first_err = array('i')
+
+    def __len__(self):
+        return len(self.len_in)
+
+    def add(self, line_in: str, code: str, line_out):
+        """ line_out 为 None 或空串表示未上屏(与文件模式读取输出时的口径一致: "commit: " 后为空即未上屏) """
+        self.len_in.append(len(line_in))
+        self.len_code.append(len(code.rstrip("1")))
+        if not line_out:
+            self.committed.append(0)
+            self.exact.append(0)
+            self.dist.append(0)
+            self.first_err.append(-1)
+        elif line_in == line_out:
+            self.committed.append(1)
+            self.exact.append(1)
+            self.dist.append(0)
+            self.first_err.append(-1)
+        else:
+            self.committed.append(1)
+            self.exact.append(0)
+            self.dist.append(edit_distance(line_in, line_out))
+            self.first_err.append(common_prefix(line_in, line_out))
+
+    def totals(self) -> tuple:
+        """ 返回 (短句总数, 完全正确数, 汉字总数, 正确字数, 全部字数, 总码长), 与 output_result 的口径一致 """
+        if np is not None and len(self):
+            len_in = np.frombuffer(self.len_in, dtype=np.uint32).astype(np.int64)
+            committed = np.frombuffer(self.committed, dtype=np.uint8).astype(np.int64)
+            dist = np.frombuffer(self.dist, dtype=np.uint32).astype(np.int64)
+            exact = np.frombuffer(self.exact, dtype=np.uint8)
+            len_code = np.frombuffer(self.len_code, dtype=np.uint32)
+            return (int(committed.sum()), int(exact.sum()), int((len_in * committed).sum()),
+                    int(((len_in - np.minimum(dist, len_in)) * committed).sum()), int(len_in.sum()), int(len_code.sum()))
+        cnt_line, cnt_char, cnt_correct = 0, 0, 0
+        for n, c, d in zip(self.len_in, self.committed, self.dist):
+            if c:
+                cnt_line += 1
+                cnt_char += n
+                cnt_correct += n - min(d, n)
+        return (cnt_line, sum(self.exact), cnt_char, cnt_correct, sum(self.len_in), sum(self.len_code))
+
+
+def percentiles(values) -> tuple:
+    """ 返回 (个数, p50, p90, p99, 最大值), 分位数取最近秩(不插值, 必为实测值) """
+    n = len(values)
+    if not n:
+        return (0,) + (0.0,) * (len(PERCENTILES)+1)
+    if np is not None:
+        values = np.sort(np.asarray(values, dtype=np.float64))
+    else:
+        values = sorted(values)
+    return (n, *(float(values[max(-(-p * n // 100) - 1, 0)]) for p in PERCENTILES), float(values[-1]))
+
+
+def bucket_of(len_in: int) -> int:
+    return bisect_right(BUCKETS_LEN, len_in) - 1
+
+
+def bucket_label(i: int) -> str:
+    lo = BUCKETS_LEN[i]
+    if i+1 == len(BUCKETS_LEN):
+        return f"{lo}+"
+    hi = BUCKETS_LEN[i+1] - 1
+    return str(lo) if lo == hi else f"{lo}-{hi}"
+
+
+class LatencyStats:
+    """ 逐句上屏耗时的列存储: 按文章、按字数分组求分位数, 并保留最慢的 k_slowest 句 """
+    def __init__(self, k_slowest: int=100):
+        self.k_slowest = k_slowest
+        self.fnames = []
+        self.article = array('I')  # 文章在 fnames 中的序号
+        self.len_in = array('I')
+        self.latency = array('d')  # 秒
+        self.heap_slowest = []  # 最小堆 (耗时, 序号, 文章名, 短句, 编码)
+
+    def __len__(self):
+        return len(self.latency)
+
+    def add(self, fname: str, line_in: str, code: str, latency: float):
+        if not self.fnames or self.fnames[-1] != fname:
+            self.fnames.append(fname)
+        self.article.append(len(self.fnames) - 1)
+        self.len_in.append(len(line_in))
+        self.latency.append(latency)
+        item = (latency, len(self.latency), fname, line_in, code)
+        if len(self.heap_slowest) < self.k_slowest:
+            heapq.heappush(self.heap_slowest, item)
+        elif self.k_slowest and latency > self.heap_slowest[0][0]:
+            heapq.heapreplace(self.heap_slowest, item)
+
+    def _groups(self, keys) -> dict:
+        """ {分组: 该组的耗时} """
+        if np is not None and len(self):
+            keys = np.asarray(keys)
+            latency = np.frombuffer(self.latency, dtype=np.float64)
+            return {int(k): latency[keys == k] for k in np.unique(keys)}
+        dict_group = {}
+        for k, v in zip(keys, self.latency):
+            dict_group.setdefault(k, []).append(v)
+        return dict_group
+
+    def by_article(self) -> list[tuple]:
+        """ [(文章名, 个数, p50, p90, p99, 最大值)], 同名文章(如分片)合并 """
+        dict_idx = {}
+        for i, fname in enumerate(self.fnames):
+            dict_idx.setdefault(fname, []).append(i)
+        dict_group = self._groups(self.article)
+        list_res = []
+        for fname, list_idx in dict_idx.items():
+            values = [dict_group[i] for i in list_idx if i in dict_group]
+            if np is not None and values:
+                values = np.concatenate(values)
+            else:
+                values = [v for g in values for v in g]
+            list_res.append((fname, *percentiles(values)))
+        return list_res
+
+    def by_length(self) -> list[tuple]:
+        """ [(字数分组, 个数, p50, p90, p99, 最大值)] """
+        keys = [bucket_of(n) for n in self.len_in]
+        return [(bucket_label(i), *percentiles(values)) for i, values in sorted(self._groups(keys).items())]
+
+    def total(self) -> tuple:
+        return percentiles(self.latency)
+
+    def slowest(self) -> list[tuple]:
+        """ 最慢的句子 [(耗时, 文章名, 短句, 编码)], 从慢到快 """
+        return [(t[0], *t[2:]) for t in sorted(self.heap_slowest, key=lambda t: (-t[0], t[1]))]
+
+
+def _ratio_ci(list_strata: list[tuple], z: float) -> tuple:
+    """ 分层抽样的比率估计 R = ΣY / ΣX 及其置信区间半宽(线性化方差, 含有限总体校正)
+    list_strata 为 [(层的总句数, [y], [x])] """
+    total_y, total_x = 0.0, 0.0
+    for n_pop, ys, xs in list_strata:
+        if ys:
+            total_y += n_pop * sum(ys) / len(ys)
+            total_x += n_pop * sum(xs) / len(xs)
+    if not total_x:
+        return 0.0, 0.0
+    r = total_y / total_x
+    var = 0.0
+    for n_pop, ys, xs in list_strata:
+        n = len(ys)
+        if n < 2 or n >= n_pop:
+            continue
+        ds = [y - r * x for y, x in zip(ys, xs)]
+        mean = sum(ds) / n
+        var += n_pop * n_pop * (1 - n / n_pop) * sum((d - mean) ** 2 for d in ds) / (n - 1) / n
+    return r, z * math.sqrt(var) / total_x
+
+
+class StratifiedSample:
+    """ 按 (文章, 字数分组) 分层的随机抽样, 各层按比例分配(有两句及以上的层至少抽两句, 以便估计方差)
+    各层按固定种子各自打乱一次, 扩大样本时只取更长的前缀: 已抽的句子保留, 结果与一次抽够相同 """
+    def __init__(self, keys: list[tuple], seed: int=SEED_SAMPLE):
+        self.keys = keys  # 各句所在的层
+        self.dict_idx = {}  # 层: 打乱后的句子序号
+        for i, key in enumerate(keys):
+            self.dict_idx.setdefault(key, []).append(i)
+        for key, list_idx in self.dict_idx.items():
+            random.Random("|".join(map(str, (seed, *key)))).shuffle(list_idx)
+        self.dict_taken = {key: 0 for key in self.dict_idx}
+        self.dict_stats = {key: SentenceStats() for key in self.dict_idx}
+
+    def __len__(self):
+        return sum(self.dict_taken.values())
+
+    def draw(self, size: int) -> list[int]:
+        """ 把样本扩大到约 size 句, 返回新抽到的句子序号(按原顺序) """
+        list_new = []
+        for key, list_idx in self.dict_idx.items():
+            n_pop = len(list_idx)
+            n = min(n_pop, max(round(size * n_pop / len(self.keys)), 2))
+            if n > self.dict_taken[key]:
+                list_new += list_idx[self.dict_taken[key]:n]
+                self.dict_taken[key] = n
+        return sorted(list_new)
+
+    def add(self, i: int, line_in: str, code: str, line_out):
+        self.dict_stats[self.keys[i]].add(line_in, code, line_out)
+
+    def estimate(self, z: float=Z_95) -> list[tuple]:
+        """ [(完全准确率, 半宽), (综合准确率, 半宽), (平均码长, 半宽)], 口径同 SentenceStats.totals """
+        list_line, list_char, list_code = [], [], []
+        for key, stats in self.dict_stats.items():
+            n_pop = len(self.dict_idx[key])
+            correct = [n - min(d, n) for n, d in zip(stats.len_in, stats.dist)]
+            list_line.append((n_pop, list(stats.exact), list(stats.committed)))
+            list_char.append((n_pop, [c * k for c, k in zip(stats.committed, correct)],
+                              [c * n for c, n in zip(stats.committed, stats.len_in)]))
+            list_code.append((n_pop, list(stats.len_code), list(stats.len_in)))
+        return [_ratio_ci(list_strata, z) for list_strata in (list_line, list_char, list_code)]
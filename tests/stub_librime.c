@@ -0,0 +1,107 @@
+/*
+ * librime 的桩库(测试 LibrimeEngine 用): 导出 LibrimeEngine 用到的同名 C 函数, 结构体按 rime_api.h 定义
+ * 输入的按键原样累积, 以 1 结尾时上屏去掉 1 的部分; 以 x 开头时上屏非法的 UTF-8(用于测试乱码重试)
+ * 编译: cc -shared -fPIC -o stub_librime.so stub_librime.c
+ */
+#include <stddef.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+typedef uintptr_t RimeSessionId;
+typedef int Bool;
+
+typedef struct {
+    int data_size;
+    const char* shared_data_dir;
+    const char* user_data_dir;
+    const char* distribution_name;
+    const char* distribution_code_name;
+    const char* distribution_version;
+    const char* app_name;
+    const char** modules;
+    int min_log_level;
+    const char* log_dir;
+    const char* prebuilt_data_dir;
+    const char* staging_dir;
+} RimeTraits;
+
+typedef struct {
+    int data_size;
+    char* text;
+} RimeCommit;
+
+static char keys[4096];
+static int cnt_setup, cnt_initialize, cnt_finalize, cnt_bad_struct, cnt_sessions;
+
+/* 供测试核对结构体布局: 各字段的偏移, 最后一项为结构体大小 */
+size_t stub_traits_layout(int i) {
+    static const size_t layout[] = {
+        offsetof(RimeTraits, data_size), offsetof(RimeTraits, shared_data_dir), offsetof(RimeTraits, user_data_dir),
+        offsetof(RimeTraits, distribution_name), offsetof(RimeTraits, distribution_code_name),
+        offsetof(RimeTraits, distribution_version), offsetof(RimeTraits, app_name), offsetof(RimeTraits, modules),
+        offsetof(RimeTraits, min_log_level), offsetof(RimeTraits, log_dir), offsetof(RimeTraits, prebuilt_data_dir),
+        offsetof(RimeTraits, staging_dir), sizeof(RimeTraits)};
+    return layout[i];
+}
+
+size_t stub_commit_layout(int i) {
+    static const size_t layout[] = {offsetof(RimeCommit, data_size), offsetof(RimeCommit, text), sizeof(RimeCommit)};
+    return layout[i];
+}
+
+int stub_count(const char* name) {
+    if (!strcmp(name, "setup")) return cnt_setup;
+    if (!strcmp(name, "initialize")) return cnt_initialize;
+    if (!strcmp(name, "finalize")) return cnt_finalize;
+    if (!strcmp(name, "bad_struct")) return cnt_bad_struct;
+    if (!strcmp(name, "sessions")) return cnt_sessions;
+    return -1;
+}
+
+static void check_traits(RimeTraits* traits) {
+    if (traits->data_size != (int)(sizeof(RimeTraits) - sizeof(int)) || !traits->user_data_dir
+            || !traits->app_name || strcmp(traits->app_name, "rime.autorime"))
+        cnt_bad_struct++;
+}
+
+void RimeSetup(RimeTraits* traits) { cnt_setup++; check_traits(traits); }
+void RimeInitialize(RimeTraits* traits) { cnt_initialize++; check_traits(traits); }
+void RimeFinalize(void) { cnt_finalize++; }
+Bool RimeStartMaintenance(Bool full_check) { (void)full_check; return 0; }
+void RimeJoinMaintenanceThread(void) {}
+RimeSessionId RimeCreateSession(void) { keys[0] = '\0'; cnt_sessions++; return 1; }
+Bool RimeDestroySession(RimeSessionId session_id) { cnt_sessions--; return session_id == 1; }
+void RimeClearComposition(RimeSessionId session_id) { (void)session_id; keys[0] = '\0'; }
+
+Bool RimeSimulateKeySequence(RimeSessionId session_id, const char* key_sequence) {
+    if (session_id != 1 || strlen(keys) + strlen(key_sequence) >= sizeof(keys))
+        return 0;
+    strcat(keys, key_sequence);
+    return 1;
+}
+
+Bool RimeGetCommit(RimeSessionId session_id, RimeCommit* commit) {
+    size_t len = strlen(keys);
+    if (commit->data_size != (int)(sizeof(RimeCommit) - sizeof(int))) {
+        cnt_bad_struct++;
+        return 0;
+    }
+    if (session_id != 1 || len == 0 || keys[len-1] != '1')
+        return 0;
+    commit->text = malloc(len);
+    if (keys[0] == 'x') {
+        strcpy(commit->text, "\xff");
+    } else {
+        memcpy(commit->text, keys, len-1);
+        commit->text[len-1] = '\0';
+    }
+    keys[0] = '\0';
+    return 1;
+}
+
+Bool RimeFreeCommit(RimeCommit* commit) {
+    free(commit->text);
+    commit->text = NULL;
+    return 1;
+}
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ConsolePool 的测试: 控制台用一个小替身(上屏内容即编码本身), 核对输出与输入的对齐、乱码重试和填充
+# 用法: python -m unittest discover -s tests
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+DIR_TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIR_TESTS))
+
+from rime_lib import ConsolePool  # noqa: E402
+
+# 替身: 编码去掉末尾的 1 后原样上屏, 输入的按键逐行记入日志; 第 drop 个编码不上屏, 第 garble 个编码上屏乱码
+CONSOLE = r'''
+import sys
+file_log, drop, garble = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+fw, cnt = sys.stdout.buffer, 0
+with open(file_log, 'a', encoding='utf-8') as fl:
+    for raw in sys.stdin.buffer:
+        line = raw.decode('utf-8').strip()
+        if line == "exit":
+            break
+        if not line:
+            continue
+        if line.startswith("set option "):
+            fw.write(line[len("set option "):].encode('utf-8') + b" set on.\n")
+            continue
+        fl.write(line + "\n")
+        cnt += 1
+        if cnt == drop:
+            continue
+        fw.write(b"commit: " + (b"\xff" if cnt == garble else line[:-1].encode('utf-8')) + b"\n")
+fw.flush()
+'''
+
+
+class TestConsolePool(unittest.TestCase):
+    def setUp(self):
+        self.dir_tmp = tempfile.mkdtemp()
+        self.file_console = os.path.join(self.dir_tmp, 'console.py')
+        with open(self.file_console, 'w', encoding='utf-8') as fw:
+            fw.write(CONSOLE)
+        self.dir_schema = os.path.join(self.dir_tmp, 'schema')
+        os.makedirs(self.dir_schema)
+        self.codes = [f"c{i}1" for i in range(1000)]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_tmp, ignore_errors=True)
+
+    def pool(self, num_workers: int, drop: int=0, garble: int=0) -> ConsolePool:
+        self.file_log = os.path.join(self.dir_tmp, f'keys_{num_workers}_{drop}_{garble}.log')
+        cmd = [sys.executable, self.file_console, self.file_log, str(drop), str(garble)]
+        return ConsolePool(cmd, self.dir_schema, os.path.join(self.dir_tmp, 'workers'), num_workers, chunk_size=100)
+
+    def typed(self) -> list[str]:
+        with open(self.file_log, 'r', encoding='utf-8') as fr:
+            return fr.read().split()
+
+    def test_aligned(self):
+        for num_workers in [1, 3]:
+            pool = self.pool(num_workers)
+            self.assertEqual(list(pool.run(self.codes)), [code[:-1] for code in self.codes])
+            # 只输入了句子的编码, 没有填充编码
+            self.assertEqual(sorted(self.typed()), sorted(self.codes))
+
+    def test_retry(self):
+        # 最后一批中的乱码: 输入结束后只为重试补填充标记, 重试的编码只输入一次
+        pool = self.pool(1, garble=995)
+        self.assertEqual(list(pool.run(self.codes)), [code[:-1] for code in self.codes])
+        self.assertEqual(pool.workers[0].cnt_retry, 1)
+        self.assertEqual(self.typed(), self.codes + [self.codes[994]])
+
+    def test_dropped_commit(self):
+        # 第 250 个编码没有上屏: 报错, 已产出的结果只有核对过的前两批, 且都与输入对齐
+        pool = self.pool(1, drop=250)
+        lines_out = []
+        with self.assertRaises(BaseException) as cm:
+            for line_out in pool.run(self.codes):
+                lines_out.append(line_out)
+        self.assertIn("少于", str(cm.exception))
+        self.assertEqual(lines_out, [code[:-1] for code in self.codes[:200]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 出错后续跑的测试: 替身 fake_console.py 丢掉一句上屏结果使模拟中途报错, 已记入断点(分片进度)的结果须与输入对齐,
+# 用正常的替身续跑后统计结果与一次跑完的相同; 用法: python -m unittest discover -s tests
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+DIR_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DIR_ROOT)
+
+from auto_rime import AutoRime  # noqa: E402
+from corpus_lib import ShardManifest  # noqa: E402
+
+
+class TestResume(unittest.TestCase):
+    def setUp(self):
+        # 临时的程序根目录: 字符集、码表和文章取自本项目, Rime 程序用替身 fake_console.py
+        self.dir_cwd = os.getcwd()
+        self.dir_tmp = tempfile.mkdtemp()
+        dir_auto = os.path.join(DIR_ROOT, 'auto_rime')
+        dir_tmp_auto = os.path.join(self.dir_tmp, 'auto_rime')
+        shutil.copytree(os.path.join(dir_auto, 'charsets'), os.path.join(dir_tmp_auto, 'charsets'))
+        shutil.copytree(os.path.join(dir_auto, 'articles'), os.path.join(dir_tmp_auto, 'articles'))
+        shutil.copy(os.path.join(dir_auto, 'mapping_table.txt'), dir_tmp_auto)
+        os.makedirs(os.path.join(self.dir_tmp, 'Rime'))
+        dir_bin = os.path.join(os.path.join(self.dir_tmp, 'librime_x86'), 'bin')
+        os.makedirs(dir_bin)
+        for fname in ['rime_deployer', 'rime_api_console']:
+            open(os.path.join(dir_bin, fname), 'w').close()
+        os.chdir(self.dir_tmp)
+
+    def tearDown(self):
+        os.chdir(self.dir_cwd)
+        shutil.rmtree(self.dir_tmp, ignore_errors=True)
+
+    def create(self, drop: int=0) -> AutoRime:
+        # 单进程, 不复用以往结果; drop 不为 0 时第 drop 个编码没有上屏结果
+        ar = AutoRime(num_workers=1, incremental=False, deploy=False)
+        ar.file_exe_console = [sys.executable, os.path.join(DIR_ROOT, 'fake_console.py'), ar.file_mapping,
+                               '--drop', str(drop)]
+        ar.list_result = []
+        ar.output_result = lambda stats, fname="": ar.list_result.append((fname, tuple(stats)))
+        return ar
+
+    def test_resume_articles(self):
+        ar = self.create()
+        fnames = sorted(f for f in os.listdir(ar.dir_articles) if f.endswith(".txt"))
+        ar.prepare_articles(fnames)
+        ar.simulate_all(fnames)
+        dict_commits = {fname: ar.checkpoint.load(fname, ar.article_key(fname))["commits"] for fname in fnames}
+        dict_stats = {fname: ar.get_statistics(fname) for fname in fnames}
+        shutil.rmtree(ar.checkpoint.dir_checkpoint)
+        os.makedirs(ar.checkpoint.dir_checkpoint)
+
+        # 第 700 句没有上屏: 前三批(600 句)核对过, 只有其中完整的文章记入断点, 且与一次跑完的结果相同
+        ar = self.create(700)
+        ar.prepare_articles(fnames)
+        with self.assertRaises(BaseException):
+            ar.simulate_all(fnames)
+        fnames_saved = [fname for fname in fnames if ar.checkpoint.load(fname, ar.article_key(fname)) is not None]
+        self.assertTrue(0 < len(fnames_saved) < len(fnames))
+        for fname in fnames_saved:
+            self.assertEqual(ar.checkpoint.load(fname, ar.article_key(fname))["commits"], dict_commits[fname])
+
+        ar = self.create()
+        dict_done, fnames_simulated = ar.resume_articles(fnames)
+        self.assertEqual(sorted(fnames_simulated), fnames_saved)
+        fnames_todo = [fname for fname in fnames if fname not in fnames_simulated]
+        ar.prepare_articles(fnames_todo)
+        ar.simulate_all(fnames_todo)
+        self.assertEqual({fname: ar.get_statistics(fname) for fname in fnames}, dict_stats)
+
+    def test_resume_shards(self):
+        ar = self.create()
+        fnames = sorted(f for f in os.listdir(ar.dir_articles) if f.endswith(".txt"))
+        ar.simulate_sharded(fnames, 4 << 10)
+        stats_all = ar.list_result[-1]
+        shutil.rmtree(ar.dir_shards)
+
+        # 第 700 句没有上屏: 只有核对过的分片记为完成, 重跑时跳过它们, 合计与一次跑完的相同
+        ar = self.create(700)
+        with self.assertRaises(BaseException):
+            ar.simulate_sharded(fnames, 4 << 10)
+        cnt_done = sum(len(ShardManifest(os.path.join(os.path.join(ar.dir_shards, os.path.splitext(fname)[0]), 'manifest.json'),
+                                         ar.article_key(fname, 4 << 10)).dict_done) for fname in fnames)
+        self.assertGreater(cnt_done, 0)
+
+        ar = self.create()
+        ar.simulate_sharded(fnames, 4 << 10)
+        self.assertEqual(ar.list_result[-1], stats_all)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 同一批上屏结果分别经文件模式、流式模式、分片模式统计, 结果应完全相同(含 "commit: " 后为空的未上屏行)
+# 用法: python -m unittest discover -s tests
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+DIR_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DIR_ROOT)
+
+from auto_rime import AutoRime  # noqa: E402
+
+
+class TestStatsModes(unittest.TestCase):
+    def setUp(self):
+        # 临时的程序根目录: 字符集、码表和文章取自本项目, Rime 程序用替身 fake_console.py
+        self.dir_cwd = os.getcwd()
+        self.dir_tmp = tempfile.mkdtemp()
+        dir_auto = os.path.join(DIR_ROOT, 'auto_rime')
+        dir_tmp_auto = os.path.join(self.dir_tmp, 'auto_rime')
+        shutil.copytree(os.path.join(dir_auto, 'charsets'), os.path.join(dir_tmp_auto, 'charsets'))
+        shutil.copytree(os.path.join(dir_auto, 'articles'), os.path.join(dir_tmp_auto, 'articles'))
+        shutil.copy(os.path.join(dir_auto, 'mapping_table.txt'), dir_tmp_auto)
+        os.makedirs(os.path.join(self.dir_tmp, 'Rime'))
+        dir_bin = os.path.join(os.path.join(self.dir_tmp, 'librime_x86'), 'bin')
+        os.makedirs(dir_bin)
+        for fname in ['rime_deployer', 'rime_api_console']:
+            open(os.path.join(dir_bin, fname), 'w').close()
+        # 替身少了部分字的编码, 切分不完的编码输出空的 "commit: "
+        file_console = os.path.join(self.dir_tmp, 'mapping_console.txt')
+        with open(os.path.join(dir_auto, 'mapping_table.txt'), 'r', encoding='utf-8') as fr, \
+             open(file_console, 'w', encoding='utf-8') as fw:
+            lines = fr.readlines()
+            codes_dropped = set(sorted({line.rstrip("\n").split("\t")[-1] for line in lines})[::20])
+            fw.write("".join(line for line in lines if line.rstrip("\n").split("\t")[-1] not in codes_dropped))
+        self.cmd_console = [sys.executable, os.path.join(DIR_ROOT, 'fake_console.py'), file_console]
+        os.chdir(self.dir_tmp)
+
+    def tearDown(self):
+        os.chdir(self.dir_cwd)
+        shutil.rmtree(self.dir_tmp, ignore_errors=True)
+
+    def create(self):
+        ar = AutoRime(num_workers=2, incremental=False, deploy=False)
+        ar.file_exe_console = self.cmd_console
+        ar.list_result = []
+        output_result = ar.output_result
+
+        def record(stats, fname=""):
+            ar.list_result.append((fname, tuple(stats)))
+            output_result(stats, fname)
+        ar.output_result = record
+        return ar
+
+    def test_file_stream_sharded(self):
+        ar = self.create()
+        fnames = sorted(f for f in os.listdir(ar.dir_articles) if f.endswith(".txt"))
+        ar.prepare_articles(fnames)
+        ar.simulate_all(fnames)
+        stats_file = [0, 0, 0, 0, 0, 0]
+        for fname in fnames:
+            stats = ar.get_statistics(fname)
+            for i in range(6):
+                stats_file[i] += stats[i]
+        stats_file = tuple(stats_file)
+        # 空的 "commit: " 记为未上屏
+        self.assertLess(stats_file[2], stats_file[4])
+
+        ar = self.create()
+        ar.simulate_stream(fnames)
+        self.assertEqual(ar.list_result[-1], ("", stats_file))
+
+        ar = self.create()
+        ar.simulate_sharded(fnames, 4 << 10)
+        self.assertEqual(ar.list_result[-1], ("", stats_file))
+
+
+if __name__ == '__main__':
+    unittest.main()